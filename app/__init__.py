@@ -3,10 +3,8 @@ import os
 import sys
 from os import path
 
-from flask import (Flask)
-
 from . import config as app_config
-from .util import generic_response
+from .util import generic_response, StartupTimes
 
 __version__ = '1.0'
 __all__ = ['create']
@@ -21,18 +19,29 @@ def create(root_path, config_name):
     requisite extensions, and application modules.
     """
 
-    app = Flask(__name__)
-    config = app_config.for_context(config_name)
+    startup_times = StartupTimes()
+
+    with startup_times.phase('flask'):
+        from flask import Flask
+        app = Flask(__name__)
+
+    with startup_times.phase('config'):
+        config = app_config.for_context(config_name)
 
-    app.config.update(config)
-    app.config['BASE_DIR'] = root_path
-    app.config['CONFIG_NAME'] = config_name
-    initialize_logging(app)
+        app.config.update(config)
+        app.config['BASE_DIR'] = root_path
+        app.config['CONFIG_NAME'] = config_name
+
+    with startup_times.phase('logging'):
+        initialize_logging(app)
 
     with app.app_context():
-        register_application_modules(app)
+        register_application_modules(app, startup_times)
         register_error_handlers(app)
 
+    app.extensions['startup_times'] = startup_times
+    LOG.info('Startup times - {}'.format(startup_times))
+
     return app
 
 
@@ -58,13 +67,19 @@ def register_error_handlers(app):
     app.error_handler_spec[None][400] = lambda *args, **kwargs: generic_response(400)
 
 
-def register_application_modules(app):
+def register_application_modules(app, startup_times):
     """
     Register the requisite application submodules/blueprints with the app.
     """
 
-    from . import api
-    api.init(app)
+    # flask_restful comes in with the api module. Its Resource classes are
+    # built on it when the module is imported, so it can only be deferred
+    # to here, where the routes have to be registered anyway.
+    with startup_times.phase('import_api'):
+        from . import api
+
+    with startup_times.phase('init_api'):
+        api.init(app)
 
     @app.route('/ping')
     def ping():
@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import logging
+import threading
+
+from flask import jsonify, Response
+
+from .util import Header
+
+__all__ = [
+    'admission',
+    'AdmissionController',
+    'AsyncAdmissionController',
+    'AdmissionRejectedError',
+]
+
+LOG = logging.getLogger(__name__)
+SERVICE_UNAVAILABLE = 503
+
+
+class AdmissionRejectedError(Exception):
+    pass
+
+
+class AdmissionController(object):
+    """
+    Bounds the requests in flight for an endpoint. Requests over the concurrency
+    limit wait in a bounded queue for up to queue_timeout_secs, past that they are
+    rejected rather than piling more upstream work onto an overloaded server.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue, queue_timeout_secs, retry_after_secs):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_secs = queue_timeout_secs
+        self.retry_after_secs = retry_after_secs
+
+        self._released = threading.Condition(threading.Lock())
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _admissible(self, weight):
+        return self._in_flight + weight <= self.max_concurrency
+
+    def acquire(self, weight=1):
+        """
+        Take weight of the concurrency slots, a request that does the work of many
+        (a batch) takes more than one. The weight is capped at max_concurrency.
+        """
+
+        weight = min(weight, self.max_concurrency)
+
+        with self._released:
+            if not self._admissible(weight):
+                if self._waiting >= self.max_queue:
+                    raise AdmissionRejectedError()
+
+                self._waiting += 1
+                try:
+                    admitted = self._released.wait_for(lambda: self._admissible(weight), self.queue_timeout_secs)
+                finally:
+                    self._waiting -= 1
+
+                if not admitted:
+                    raise AdmissionRejectedError()
+
+            self._in_flight += weight
+
+        return weight
+
+    def release(self, weight=1):
+        with self._released:
+            self._in_flight -= weight
+            self._released.notify_all()
+
+    def rejected_response(self):
+        response = jsonify(meta=dict(status_code=SERVICE_UNAVAILABLE))
+        response.status_code = SERVICE_UNAVAILABLE
+        response.headers[Header.retry_after.value] = str(self.retry_after_secs)
+        return response
+
+
+class AsyncAdmissionController(object):
+    """
+    AdmissionController for the requests of an asyncio server, the requests in the
+    queue are coroutines waiting on the slots rather than threads.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue, queue_timeout_secs, retry_after_secs):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_secs = queue_timeout_secs
+        self.retry_after_secs = retry_after_secs
+
+        self._released = None
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _admissible(self, weight):
+        return self._in_flight + weight <= self.max_concurrency
+
+    async def acquire(self, weight=1):
+        """Same as AdmissionController.acquire"""
+
+        weight = min(weight, self.max_concurrency)
+
+        if not self._admissible(weight):
+            if self._waiting >= self.max_queue:
+                raise AdmissionRejectedError()
+
+            if self._released is None:
+                # Made on first use, in the event loop that serves the requests
+                self._released = asyncio.Condition()
+
+            self._waiting += 1
+            try:
+                async with self._released:
+                    await asyncio.wait_for(self._released.wait_for(lambda: self._admissible(weight)),
+                                           self.queue_timeout_secs)
+            except asyncio.TimeoutError as e:
+                raise AdmissionRejectedError() from e
+            finally:
+                self._waiting -= 1
+
+        self._in_flight += weight
+        return weight
+
+    async def release(self, weight=1):
+        self._in_flight -= weight
+
+        if self._released is not None:
+            async with self._released:
+                self._released.notify_all()
+
+
+class Admission(object):
+    """Registry of the admission controllers by endpoint name"""
+
+    def __init__(self):
+        self.controllers = {}
+
+    def register(self, controller):
+        self.controllers[controller.name] = controller
+
+    def limit(self, name, bypass=None, weight=None):
+        """
+        Resource method decorator that admits the request through the named
+        controller. Requests for which bypass() is true, because they can be answered
+        from cache alone, skip the limiter. weight() is how many slots the request
+        takes, one by default. Streamed responses hold their slots until the response
+        is closed.
+        """
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                controller = self.controllers.get(name)
+                if controller is None or (bypass is not None and bypass()):
+                    return func(*args, **kwargs)
+
+                try:
+                    slots = controller.acquire(weight() if weight is not None else 1)
+                except AdmissionRejectedError:
+                    LOG.warning('Rejected request over the admission limit - endpoint: {}'.format(name))
+                    return controller.rejected_response()
+
+                release = functools.partial(controller.release, slots)
+                release_on_close = False
+                try:
+                    response = func(*args, **kwargs)
+                    if isinstance(response, Response) and response.is_streamed:
+                        response.call_on_close(release)
+                        release_on_close = True
+                    return response
+                finally:
+                    if not release_on_close:
+                        release()
+
+            return wrapper
+
+        return decorator
+
+
+#: "Singleton" instance that the endpoint controllers are registered with when
+#: the api is initialized.
+admission = Admission()
@@ -0,0 +1,488 @@
+import asyncio
+import functools
+import logging
+import uuid
+
+import aiohttp
+
+from .cache import SimpleCache
+from .photo import PHOTO_MAX_WIDTH, NoSuchPhotoError, PhotoCacheEntry
+from .planner import SearchArea, enclosing_area, roots, tiles
+from .search import (SEARCH_LIMIT, TILE_RESULT_LIMIT, PAGE_TOKEN_ATTEMPTS, PAGE_TOKEN_DELAY_SECS, CURSOR_EXPIRE_SECS,
+                     CURSOR_KEY_PREFIX, DEFAULT_PHOTO_URL, DEFAULT_SEARCH_CONCURRENCY, DEFAULT_TILE_RADIUS_METERS,
+                     DEFAULT_MAX_TILES, DEFAULT_SEARCH_CACHE_EXPIRE_SECS, PHOTO_CACHE_ENTRY_EXPIRE_SECS,
+                     NoSuchCursorError, PlaceResult, batch_results, caches_first_places, cursor_state,
+                     details_cache_key, format_location, merge_tile_places, places_cache_key, plan_small_areas,
+                     rank_places, rank_venues, to_response_venue, unique_places, venue_photo_url)
+
+__all__ = [
+    'AsyncCache',
+    'AsyncGoogleAPIError',
+    'AsyncGooglePlaces',
+    'AsyncSearchEngine',
+    'AsyncPhotoManager',
+]
+
+LOG = logging.getLogger(__name__)
+DEFAULT_MAX_CONNECTIONS = 256
+
+
+class AsyncGoogleAPIError(Exception):
+    def __init__(self, status, message=None):
+        Exception.__init__(self, status, message)
+        self.status = status
+
+
+class AsyncCache(object):
+    """
+    Coroutine access to a SimpleCache or RedisCache. Calls to a cache over the
+    network run in the default executor so they do not block the event loop, the
+    in-process SimpleCache is called directly.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def run(self, func, *args):
+        if isinstance(self.cache, SimpleCache):
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+    async def get(self, key):
+        return await self.run(self.cache.get, key)
+
+    async def set(self, key, value, expire_secs=None):
+        """Set the key, with an expiry when expire_secs is given. Returns whether it was set."""
+
+        def set_and_expire():
+            if not self.cache.set(key, value):
+                return False
+            if expire_secs is not None:
+                self.cache.expire(key, expire_secs)
+            return True
+
+        return await self.run(set_and_expire)
+
+
+class AsyncGooglePlaces(object):
+    """
+    asyncio client for the Google Places web service. All of the calls share one
+    pooled HTTP session, so a call in flight is a coroutine and a pooled
+    connection rather than a thread.
+    """
+
+    BASE_URL = 'https://maps.googleapis.com/maps/api/place/'
+
+    def __init__(self, api_key, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._session = None
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        self._session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_json(self, path, **params):
+        params['key'] = self.api_key
+
+        async with self._session.get(self.BASE_URL + path, params=params) as response:
+            response.raise_for_status()
+            body = await response.json()
+
+        status = body.get('status')
+        if status != 'OK':
+            raise AsyncGoogleAPIError(status, body.get('error_message'))
+
+        return PlaceResult(body)
+
+    async def get_places(self, location, radius, pagetoken=None):
+        params = {'location': location, 'radius': radius}
+        if pagetoken is not None:
+            params['pagetoken'] = pagetoken
+
+        response = await self._get_json('nearbysearch/json', **params)
+        response['results'] = [PlaceResult(r) for r in response.get('results', [])]
+        return response
+
+    async def get_details(self, placeid):
+        response = await self._get_json('details/json', placeid=placeid)
+        response['result'] = PlaceResult(response['result'])
+        return response
+
+    async def get_photo(self, photoreference, maxwidth):
+        params = {'photoreference': photoreference, 'maxwidth': maxwidth, 'key': self.api_key}
+
+        async with self._session.get(self.BASE_URL + 'photo', params=params) as response:
+            if response.status != 200:
+                raise AsyncGoogleAPIError(response.status)
+            return await response.read()
+
+
+class AsyncSearchEngine(object):
+    """
+    The Places Search Engine on asyncio. The calls upstream are coroutines on an
+    AsyncGooglePlaces client, the planning, ranking and cache keys are the same
+    as SearchEngine's so the two serve the same results from the same cache.
+    """
+
+    def __init__(self, hostname, port, loc, googleplaces, cache,
+                 search_concurrency=DEFAULT_SEARCH_CONCURRENCY,
+                 tile_radius=DEFAULT_TILE_RADIUS_METERS,
+                 max_tiles=DEFAULT_MAX_TILES,
+                 search_cache_expire_secs=DEFAULT_SEARCH_CACHE_EXPIRE_SECS):
+        self.hostname = hostname
+        self.port = port
+        self.loc = loc
+        self.googleplaces = googleplaces
+        self.cache = AsyncCache(cache)
+        self.search_concurrency = search_concurrency
+        #: Bounds the searches upstream for the whole process, like SearchEngine's
+        self._upstream_searches = asyncio.Semaphore(search_concurrency)
+        self.tile_radius = tile_radius
+        self.max_tiles = max_tiles
+        self.search_cache_expire_secs = search_cache_expire_secs
+
+    async def photo_url_for_venue(self, venue, default_url=None):
+        photo_url_key = venue['uuid']
+        photo_url = await self.cache.get(photo_url_key)
+
+        if photo_url:
+            return photo_url
+
+        photo_url = venue_photo_url(venue, self.hostname, self.port, self.loc)
+
+        if photo_url:
+            await self.cache.set(photo_url_key, photo_url, PHOTO_CACHE_ENTRY_EXPIRE_SECS)
+        elif default_url is not None:
+            photo_url = default_url
+        else:
+            photo_url = DEFAULT_PHOTO_URL
+
+        return photo_url
+
+    async def _search_page(self, area, page_token=None):
+        """
+        A single page of places for the area, the token for the page after it and
+        whether the page came back, no results included. Each page takes its own
+        turn at the upstream searches.
+        """
+
+        location = format_location(area.latitude, area.longitude)
+
+        for attempt in range(1, PAGE_TOKEN_ATTEMPTS + 1):
+            try:
+                async with self._upstream_searches:
+                    response = await self.googleplaces.get_places(location=location, radius=area.radius,
+                                                                  pagetoken=page_token)
+
+                LOG.debug('Google Places results - results_count: {}'.format(len(response.results)))
+                places = [PlaceResult.copy_of(result) for result in response.results]
+                return places, response.get('next_page_token'), True
+
+            except AsyncGoogleAPIError as e:
+                if e.status == 'ZERO_RESULTS':
+                    LOG.info('No Results for search')
+                    return [], None, True
+
+                # A fresh page token is INVALID_REQUEST until it becomes active
+                if page_token is None or e.status != 'INVALID_REQUEST' or attempt == PAGE_TOKEN_ATTEMPTS:
+                    LOG.exception('Error searching google places')
+                    break
+                await asyncio.sleep(PAGE_TOKEN_DELAY_SECS)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                LOG.exception('Error searching google places')
+                break
+
+        return [], None, False
+
+    async def _search_places(self, area, max_results):
+        """The places for the area and whether the search completed"""
+
+        places = []
+        page_token = None
+
+        while len(places) < max_results:
+            page_places, page_token, completed = await self._search_page(area, page_token)
+            places.extend(page_places)
+
+            if not completed:
+                return places[:max_results], False
+            if page_token is None:
+                break
+
+        return places[:max_results], True
+
+    async def _get_cached_places(self, area, max_results):
+        """Same as SearchEngine._get_cached_places, only completed searches are cached"""
+
+        key = places_cache_key(area, max_results)
+        places = await self.cache.get(key)
+        if places is not None:
+            return places, True
+
+        places, completed = await self._search_places(area, max_results)
+        if completed:
+            await self.cache.set(key, places, self.search_cache_expire_secs)
+
+        return places, completed
+
+    async def _get_area_places(self, latitude, longitude, radius, sort_by='distance'):
+        area = SearchArea(latitude, longitude, radius)
+
+        if radius <= self.tile_radius:
+            places, _ = await self._get_cached_places(area, SEARCH_LIMIT)
+            return rank_places(latitude, longitude, places, sort_by)
+
+        area_tiles = tiles(area, self.tile_radius, self.max_tiles)
+        tile_places = await asyncio.gather(*[self._get_cached_places(tile, TILE_RESULT_LIMIT) for tile in area_tiles])
+
+        places = merge_tile_places(area, [places for places, _ in tile_places])
+        return rank_places(latitude, longitude, places, sort_by)
+
+    async def is_cached(self, latitude, longitude, radius, sort_by='distance'):
+        """True when `search` can be answered from the cache without any upstream calls"""
+
+        area = SearchArea(latitude, longitude, radius)
+
+        if radius <= self.tile_radius:
+            places = await self.cache.get(places_cache_key(area, SEARCH_LIMIT))
+            if places is None:
+                return False
+        else:
+            tile_places = [await self.cache.get(places_cache_key(tile, TILE_RESULT_LIMIT))
+                           for tile in tiles(area, self.tile_radius, self.max_tiles)]
+            if any(p is None for p in tile_places):
+                return False
+            places = merge_tile_places(area, tile_places)
+
+        for place in rank_places(latitude, longitude, places, sort_by)[:SEARCH_LIMIT]:
+            if await self.cache.get(details_cache_key(place.place_id)) is None:
+                return False
+
+        return True
+
+    async def _get_details(self, uuid):
+        try:
+            response = await self.googleplaces.get_details(placeid=uuid)
+        except Exception as e:
+            LOG.error('Exception in getting details. exception: {}'.format(e))
+            return uuid, None
+
+        return uuid, PlaceResult.copy_of(response.result)
+
+    async def _venues_as_completed(self, places_by_uuid):
+        """
+        Yield the response venues, photo url included, in the order that their
+        details calls complete.
+        """
+
+        uuids = []
+        cached_details_by_place_id = {}
+
+        for uuid in places_by_uuid:
+            details = await self.cache.get(details_cache_key(uuid))
+            if details is not None:
+                cached_details_by_place_id[uuid] = details
+            else:
+                uuids.append(uuid)
+
+        for uuid in cached_details_by_place_id:
+            yield await self._to_response_venue(places_by_uuid[uuid], cached_details_by_place_id)
+
+        for details_call in asyncio.as_completed([self._get_details(uuid) for uuid in uuids]):
+            uuid, details = await details_call
+            details_by_place_id = {}
+
+            if details is not None:
+                details_by_place_id[uuid] = details
+                await self.cache.set(details_cache_key(uuid), details, self.search_cache_expire_secs)
+
+            yield await self._to_response_venue(places_by_uuid[uuid], details_by_place_id)
+
+    async def _to_response_venue(self, place, details_by_place_id):
+        venue = to_response_venue(place, details_by_place_id)
+        venue.update({'photo_url': await self.photo_url_for_venue(venue, default_url=DEFAULT_PHOTO_URL)})
+
+        return venue
+
+    async def _places_to_response_venues(self, places_by_uuid):
+        return [venue async for venue in self._venues_as_completed(places_by_uuid)]
+
+    def rank(self, latitude, longitude, venues, sort_by='distance'):
+        """Order the venues for the response and trim them to the search limit"""
+        return rank_venues(latitude, longitude, venues, sort_by)
+
+    async def search(self, latitude, longitude, radius, sort_by='distance'):
+        """Search by distance, no name"""
+
+        places = (await self._get_area_places(latitude, longitude, radius, sort_by))[:SEARCH_LIMIT]
+        venues = await self._places_to_response_venues({p.place_id: p for p in places})
+
+        return self.rank(latitude, longitude, venues, sort_by)
+
+    async def search_as_completed(self, latitude, longitude, radius):
+        places = (await self._get_area_places(latitude, longitude, radius))[:SEARCH_LIMIT]
+
+        async for venue in self._venues_as_completed({p.place_id: p for p in places}):
+            yield venue
+
+    async def _search_areas(self, areas):
+        """Same as SearchEngine._search_areas"""
+
+        places_by_area = {}
+        exhaustive = []
+        unresolved = set(areas)
+
+        while unresolved:
+            searches = roots(unresolved)
+            results = await asyncio.gather(*[self._get_cached_places(area, SEARCH_LIMIT) for area in searches])
+
+            for area, (places, completed) in zip(searches, results):
+                places_by_area[area] = places
+                if completed and len(places) < SEARCH_LIMIT:
+                    exhaustive.append(area)
+
+            unresolved.difference_update(searches)
+
+            for area in list(unresolved):
+                enclosing = enclosing_area(area, exhaustive)
+                if enclosing is None:
+                    continue
+
+                places_by_area[area] = [p for p in places_by_area[enclosing] if area.contains_place(p)]
+                unresolved.remove(area)
+
+        return places_by_area
+
+    async def _search_tiled_areas(self, tiles_by_area, sort_by='distance'):
+        """Same as SearchEngine._search_tiled_areas"""
+
+        unique_tiles = list({tile for area_tiles in tiles_by_area.values() for tile in area_tiles})
+        results = await asyncio.gather(*[self._get_cached_places(tile, TILE_RESULT_LIMIT) for tile in unique_tiles])
+        places_by_tile = {tile: places for tile, (places, _) in zip(unique_tiles, results)}
+
+        places_by_area = {}
+        for area, area_tiles in tiles_by_area.items():
+            places = merge_tile_places(area, [places_by_tile[tile] for tile in area_tiles])
+            places_by_area[area] = rank_places(area.latitude, area.longitude, places, sort_by)[:SEARCH_LIMIT]
+
+        return places_by_area
+
+    async def batch_search(self, queries, sort_by='distance'):
+        """Same as SearchEngine.batch_search"""
+
+        areas = [SearchArea.normalized(*query) for query in queries]
+
+        separate, tiles_by_area = plan_small_areas({a for a in areas if a.radius <= self.tile_radius}, self.tile_radius)
+        tiles_by_area.update((a, tiles(a, self.tile_radius, self.max_tiles))
+                             for a in set(areas) if a.radius > self.tile_radius)
+
+        places_by_area = await self._search_areas(separate)
+        places_by_area.update(await self._search_tiled_areas(tiles_by_area, sort_by))
+
+        venues = await self._places_to_response_venues(unique_places(places_by_area))
+        return batch_results(areas, places_by_area, {venue['uuid']: venue for venue in venues}, sort_by)
+
+    async def _save_cursor(self, state):
+        if not state['places'] and not state['page_tokens']:
+            return None
+
+        cursor = uuid.uuid4().hex
+        key = CURSOR_KEY_PREFIX + cursor
+
+        if not await self.cache.set(key, state, CURSOR_EXPIRE_SECS):
+            LOG.error('Could not store the search cursor state, no cursor returned - key: {}'.format(key))
+            return None
+
+        return cursor
+
+    async def _cursor_page(self, state, places):
+        venues = await self._places_to_response_venues({p.place_id: p for p in places})
+        venues = self.rank(state['latitude'], state['longitude'], venues, state['sort_by'])
+        return venues, await self._save_cursor(state)
+
+    async def search_page(self, latitude, longitude, radius, sort_by='distance'):
+        """Same as SearchEngine.search_page"""
+
+        area = SearchArea(latitude, longitude, radius)
+
+        if radius > self.tile_radius:
+            places, page_tokens = await self._get_area_places(latitude, longitude, radius, sort_by), []
+        else:
+            places, page_token, completed = await self._search_page(area)
+            page_tokens = [(area, page_token)] if page_token else []
+
+            first_places = places[:SEARCH_LIMIT]
+            if caches_first_places(places, page_token, completed):
+                await self.cache.set(places_cache_key(area, SEARCH_LIMIT), first_places, self.search_cache_expire_secs)
+
+            places = rank_places(latitude, longitude, first_places, sort_by) + places[SEARCH_LIMIT:]
+
+        state = cursor_state(latitude, longitude, sort_by, places[SEARCH_LIMIT:], page_tokens)
+        return await self._cursor_page(state, places[:SEARCH_LIMIT])
+
+    async def search_next_page(self, cursor):
+        """Same as SearchEngine.search_next_page, cursors are shared between the two"""
+
+        state = await self.cache.get(CURSOR_KEY_PREFIX + cursor)
+        if state is None:
+            raise NoSuchCursorError()
+
+        places = list(state['places'])
+        page_tokens = list(state['page_tokens'])
+
+        while len(places) < SEARCH_LIMIT and page_tokens:
+            area, page_token = page_tokens.pop(0)
+            area = SearchArea(*area)
+            page_places, next_page_token, _ = await self._search_page(area, page_token)
+            places.extend(page_places)
+            if next_page_token:
+                page_tokens.append((area, next_page_token))
+
+        places = rank_places(state['latitude'], state['longitude'], places, state['sort_by'])
+
+        next_state = cursor_state(state['latitude'], state['longitude'], state['sort_by'], places[SEARCH_LIMIT:],
+                                  page_tokens)
+        return await self._cursor_page(next_state, places[:SEARCH_LIMIT])
+
+
+class AsyncPhotoManager(object):
+    """GooglePlacesPhotoManager fetching cache misses with an AsyncGooglePlaces client"""
+
+    def __init__(self, googleplaces, cache_conn):
+        self.gp = googleplaces
+        self.cache = AsyncCache(cache_conn)
+
+    async def is_cached(self, key):
+        return await self.cache.get(key) is not None
+
+    async def retrieve(self, key):
+        try:
+            photo = await self.cache.run(lambda: PhotoCacheEntry(self.cache.cache, key).photo)
+            LOG.debug('Retrieved photo from cache - key: {}'.format(key))
+
+        except NoSuchPhotoError:
+            photo = await self._retrieve_from_googleplaces(key)
+            if photo is None:
+                raise
+            LOG.debug('Retrieved photo from google places - key: {}'.format(key))
+
+        return photo
+
+    async def _retrieve_from_googleplaces(self, key):
+        try:
+            photo_bytes = await self.gp.get_photo(photoreference=key, maxwidth=PHOTO_MAX_WIDTH)
+        except (AsyncGoogleAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            LOG.exception('Could not get photo from google place - '
+                          'photoreference: {}; exception: {}'.format(key, e))
+            return None
+
+        cache_entry = PhotoCacheEntry(self.cache.cache, key, photo_bytes)
+        await self.cache.run(cache_entry.save)
+        return cache_entry.photo
@@ -1,20 +1,25 @@
+import json
 import logging
+from http import HTTPStatus
+from os import path
 from urllib.parse import urlunparse
 
-from flask import abort, Response
+from flask import abort, request, Response
 from flask.ext import restful
-from flask.ext.restful import Resource, marshal_with, reqparse
-from flask.ext.restful.fields import String, Boolean, List
-from rekt.httputils import HTTPStatus
-from rekt_googleplaces import GooglePlacesClient
+from flask.ext.restful import Resource, marshal, marshal_with, reqparse
+from flask.ext.restful.fields import String, Boolean, List, Nested
+from flask.ext.restful.inputs import boolean
 
+from .admission import admission, AdmissionController
 from .auth import auth_token_required
-from .cache import SimpleCache
+from .cache import CacheSnapshot, RedisCache, SimpleCache, start_snapshots
+from .client import LazyGooglePlacesClient
 from .photo import GooglePlacesPhotoManager, GooglePlacesPhotoResourceLoader
 from .photo import NoSuchPhotoError
 from .resource import resource_loader
-from .search import SearchEngine
+from .search import CURSOR_KEY_PREFIX, NoSuchCursorError, SearchEngine
 from .util import MimeType, Header, URL
+from .warm import start_scheduled_warming
 from .util import Scheme
 
 LOG = logging.getLogger(__name__)
@@ -24,19 +29,22 @@ _ENDPOINT = '/api'
 
 
 __all__ = (
+    'start_background_tasks',
     'PlacesResource',
+    'PlacesBatchResource',
     'PhotoResource',
 )
 
 
 class _RestAPIState(object):
-    def __init__(self, hostname, port, location, engine, googleplaces, cache):
+    def __init__(self, hostname, port, location, engine, googleplaces, cache, snapshot):
         self.hostname = hostname
         self.port = port
         self.location = location
         self.engine = engine
         self.googleplaces = googleplaces
         self.cache = cache
+        self.snapshot = snapshot
 
 
 def init(app):
@@ -50,18 +58,43 @@ def init(app):
     rest = _rest
 
     #: Init the rest service dependencies
-    rest.cache = SimpleCache()
-    rest.googleplaces = GooglePlacesClient(api_key=app.config['GOOGLE_PLACES_API_KEY'])
+    if app.config['CACHE_BACKEND'] == 'redis':
+        rest.cache = RedisCache(app.config['CACHE_REDIS_URL'])
+    else:
+        rest.cache = SimpleCache()
+
+    #: Warm start from the snapshot, it is kept up to date by start_background_tasks
+    rest.snapshot = None
+    if app.config.get('CACHE_SNAPSHOT_PATH') and isinstance(rest.cache, SimpleCache):
+        rest.snapshot = CacheSnapshot(path.join(app.config['BASE_DIR'], app.config['CACHE_SNAPSHOT_PATH']),
+                                      exclude_prefixes=[CURSOR_KEY_PREFIX])
+        rest.cache.restore(rest.snapshot)
+
+    rest.googleplaces = LazyGooglePlacesClient(app.config['GOOGLE_PLACES_API_KEY'])
     rest.photo_manager = GooglePlacesPhotoManager(rest.googleplaces, rest.cache)
     rest.photo_loader = GooglePlacesPhotoResourceLoader(rest.photo_manager)
     resource_loader.register_callback(Scheme.app_cache, rest.photo_loader)
 
     rest.hostname = app.config['HOSTNAME']
     rest.port = app.config.get('EXPOSE_PORT', app.config['BIND_PORT'])
-    rest.engine = SearchEngine(rest.hostname, rest.port, _ENDPOINT, rest.googleplaces, rest.cache)
+    rest.engine = SearchEngine(rest.hostname, rest.port, _ENDPOINT, rest.googleplaces, rest.cache,
+                               search_concurrency=app.config['SEARCH_CONCURRENCY'],
+                               tile_radius=app.config['SEARCH_TILE_RADIUS_METERS'],
+                               max_tiles=app.config['SEARCH_MAX_TILES'],
+                               search_cache_expire_secs=app.config['SEARCH_CACHE_EXPIRE_SECS'])
+    rest.batch_query_limit = app.config['BATCH_QUERY_LIMIT']
+
+    #: Admission control, requests over the limits are shed with a 503
+    for name in ('place', 'photo'):
+        prefix = name.upper() + '_'
+        admission.register(AdmissionController(name, app.config[prefix + 'MAX_CONCURRENCY'],
+                                               app.config[prefix + 'MAX_QUEUE'],
+                                               app.config['ADMISSION_QUEUE_TIMEOUT_SECS'],
+                                               app.config['ADMISSION_RETRY_AFTER_SECS']))
 
     #: Service API Endpoints
     rest.add_resource(PlacesResource, _ENDPOINT + '/place')
+    rest.add_resource(PlacesBatchResource, _ENDPOINT + '/place/batch')
     app.add_url_rule(_ENDPOINT + '/photo', view_func=PhotoResource.as_view('venue_photo_api'))
     rest.init_app(app)
 
@@ -69,18 +102,67 @@ def init(app):
         app.extensions = {}
 
     app.extensions['MyRestService'] = _RestAPIState(rest.hostname, rest.port, _ENDPOINT, rest.engine, rest.googleplaces,
-                                                    rest.cache)
+                                                    rest.cache, rest.snapshot)
+
+
+def start_background_tasks(app):
+    """
+    Background work for the process that serves the requests, left to the serving
+    entry points so that commands creating the app for other reasons (and the
+    prefork master) do not run it: saving the cache snapshot and re-warming the
+    cache on WARM_INTERVAL_SECS.
+    """
+
+    if _rest.snapshot is not None:
+        start_snapshots(_rest.cache, _rest.snapshot, app.config['CACHE_SNAPSHOT_INTERVAL_SECS'])
+
+    if app.config.get('WARM_MANIFEST_PATH') and app.config.get('WARM_INTERVAL_SECS'):
+        start_scheduled_warming(_rest.engine, path.join(app.config['BASE_DIR'], app.config['WARM_MANIFEST_PATH']),
+                                app.config['WARM_INTERVAL_SECS'], app.config.get('WARM_UPSTREAM_BUDGET'),
+                                app.config['WARM_CONCURRENCY'])
+
+
+def _place_is_cached():
+    args = request.args
+
+    try:
+        if 'cursor' in args or boolean(args.get('page', False)):
+            return False
+
+        return _rest.engine.is_cached(float(args['latitude']), float(args['longitude']),
+                                                               float(args['search_radius_meters']))
+    except (KeyError, ValueError):
+        return False
+
+
+def _batch_weight():
+    """A batch takes an admission slot for each of its queries"""
+    body = request.get_json(silent=True)
+    queries = body.get('queries') if isinstance(body, dict) else None
+    return max(len(queries), 1) if isinstance(queries, list) else 1
+
+
+def _photo_is_cached():
+    photo_uuid = request.args.get('uuid')
+    return photo_uuid is not None and _rest.cache.get(photo_uuid) is not None
 
 
 class PlacesResource(Resource):
-    #: Auth
-    method_decorators = [auth_token_required]
+    #: Auth, Admission
+    method_decorators = [auth_token_required, admission.limit('place', bypass=_place_is_cached)]
 
     #: Request
     request_model = reqparse.RequestParser()
     request_model.add_argument('latitude', required=True, type=float, location='args')
     request_model.add_argument('longitude', required=True, type=float, location='args')
     request_model.add_argument('search_radius_meters', required=True, type=float, location='args')
+    request_model.add_argument('stream', type=boolean, default=False, location='args')
+    #: Request - page=1 for an X-Next-Cursor to page through the rest of the places
+    request_model.add_argument('page', type=boolean, default=False, location='args')
+
+    #: Request - continuing a search from the X-Next-Cursor of a previous response
+    cursor_model = reqparse.RequestParser()
+    cursor_model.add_argument('cursor', type=str, location='args')
 
     #: Response
     response_model = {
@@ -94,21 +176,111 @@ class PlacesResource(Resource):
         'longitude': String,
     }
 
-    @marshal_with(response_model)
+    #: Streaming response - one venue record per line as its details arrive and
+    #: a closing record with the ranked order of the venue uuids.
+    stream_response_model = dict(response_model, uuid=String)
+
     def get(self, **kwargs):
 
+        cursor = self.cursor_model.parse_args().cursor
+        if cursor is not None:
+            return self._next_page(cursor)
+
         #: Throws 400 on missing args
         args = self.request_model.parse_args()
+
+        if args.stream or _accepts_ndjson():
+            return self._stream(args)
+
+        return self._search(args)
+
+    @marshal_with(response_model)
+    def _search(self, args):
         radius = args.search_radius_meters
 
-        venues = _rest.engine.search(args.latitude, args.longitude, radius)
+        if args.page:
+            venues, cursor = _rest.engine.search_page(args.latitude, args.longitude, radius)
+        else:
+            venues, cursor = _rest.engine.search(args.latitude, args.longitude, radius), None
+
         LOG.debug('{}'.format(venues))
-        return venues
+        return venues, HTTPStatus.OK, _cursor_headers(cursor)
+
+    @marshal_with(response_model)
+    def _next_page(self, cursor):
+        try:
+            venues, cursor = _rest.engine.search_next_page(cursor)
+        except NoSuchCursorError:
+            abort(HTTPStatus.BAD_REQUEST)
+
+        return venues, HTTPStatus.OK, _cursor_headers(cursor)
+
+    def _stream(self, args):
+        engine = _rest.engine
+        radius = args.search_radius_meters
+
+        def generate():
+            venues = []
+
+            for venue in engine.search_as_completed(args.latitude, args.longitude, radius):
+                venues.append(venue)
+                yield _ndjson_record(type='venue', venue=marshal(venue, self.stream_response_model))
+
+            ranked = engine.rank(args.latitude, args.longitude, venues)
+            yield _ndjson_record(type='order', uuids=[v['uuid'] for v in ranked])
+
+        return Response(generate(), content_type=MimeType.ndjson.value)
+
+
+def _cursor_headers(cursor):
+    return {Header.next_cursor.value: cursor} if cursor is not None else {}
+
+
+def _accepts_ndjson():
+    best = request.accept_mimetypes.best_match([MimeType.json.value, MimeType.ndjson.value])
+    return best == MimeType.ndjson.value
+
+
+def _ndjson_record(**record):
+    return json.dumps(record) + '\n'
+
+
+class PlacesBatchResource(Resource):
+    #: Auth, Admission - shares the limits of the single place searches, weighted by
+    #: the number of queries
+    method_decorators = [auth_token_required, admission.limit('place', weight=_batch_weight)]
+
+    #: Request - {"queries": [{"latitude": .., "longitude": .., "search_radius_meters": ..}, ...]}
+    request_model = reqparse.RequestParser()
+    request_model.add_argument('queries', required=True, type=list, location='json')
+
+    query_fields = ('latitude', 'longitude', 'search_radius_meters')
+
+    #: Response - the venues for each query in request order
+    response_model = {
+        'results': List(List(Nested(PlacesResource.response_model))),
+    }
+
+    @marshal_with(response_model)
+    def post(self):
+
+        #: Throws 400 on missing args
+        args = self.request_model.parse_args()
+
+        if len(args.queries) > _rest.batch_query_limit:
+            abort(HTTPStatus.BAD_REQUEST)
+
+        try:
+            queries = [tuple(float(q[field]) for field in self.query_fields) for q in args.queries]
+        except (KeyError, TypeError, ValueError):
+            abort(HTTPStatus.BAD_REQUEST)
+
+        return {'results': _rest.engine.batch_search(queries)}
 
 
 class PhotoResource(Resource):
-    #: Auth
-    method_decorators = [auth_token_required]
+    #: Auth, Admission
+    method_decorators = [auth_token_required, admission.limit('photo', bypass=_photo_is_cached)]
 
     #: Request
     request_model = reqparse.RequestParser()
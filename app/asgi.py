@@ -0,0 +1,366 @@
+import json
+import logging
+from os import path
+from urllib.parse import parse_qs
+
+from flask.ext.restful import marshal
+
+from . import config as app_config
+from . import initialize_logging
+from .admission import AdmissionRejectedError, AsyncAdmissionController
+from .aiosearch import AsyncGooglePlaces, AsyncPhotoManager, AsyncSearchEngine
+from .api import PlacesBatchResource, PlacesResource, _ENDPOINT
+from .auth import auth_token_required
+from .cache import CacheSnapshot, RedisCache, SimpleCache, start_snapshots
+from .photo import NoSuchPhotoError
+from .search import CURSOR_KEY_PREFIX, NoSuchCursorError
+from .util import MimeType, Header
+
+__all__ = [
+    'create',
+    'PlacesASGIApp',
+]
+
+LOG = logging.getLogger(__name__)
+_MAX_BODY_BYTES = 1024 * 1024
+
+
+class _BadRequestError(Exception):
+    pass
+
+
+class _Request(object):
+    def __init__(self, scope, receive):
+        self.path = scope['path']
+        self.method = scope['method']
+        self.args = {k: v[-1] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self._receive = receive
+
+    async def json(self):
+        """The request body as json, a body that is not json is a 400"""
+        body = b''
+        while True:
+            message = await self._receive()
+            body += message.get('body', b'')
+            if len(body) > _MAX_BODY_BYTES:
+                raise _BadRequestError('body')
+            if not message.get('more_body', False):
+                break
+
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise _BadRequestError('body') from e
+
+    def arg(self, name, cast=str, required=False, default=None):
+        """Like the reqparse arguments, a missing or malformed arg is a 400"""
+        if name not in self.args:
+            if required:
+                raise _BadRequestError(name)
+            return default
+
+        try:
+            return cast(self.args[name])
+        except ValueError as e:
+            raise _BadRequestError(name) from e
+
+
+def _boolean(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+def _parse_accept(accept):
+    """The (mimetype, quality) pairs of an Accept header"""
+    accepted = []
+
+    for item in accept.split(','):
+        mimetype, *params = [part.strip() for part in item.split(';')]
+        if not mimetype:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = max(0.0, min(float(value), 1.0))
+                except ValueError:
+                    quality = 0.0
+
+        accepted.append((mimetype.lower(), quality))
+
+    return accepted
+
+
+def _specificity(pattern, mimetype):
+    """How specifically an Accept entry matches the mimetype, None when it does not"""
+    if pattern == mimetype:
+        return 2
+    if pattern == mimetype.split('/')[0] + '/*':
+        return 1
+    if pattern in ('*/*', '*'):
+        return 0
+    return None
+
+
+def _best_match(accept, offered):
+    """
+    The offered mimetype the Accept header prefers, like flask's
+    `request.accept_mimetypes.best_match`. Each offer gets the quality of the most
+    specific entry matching it, ties go to the first offered. With no Accept header
+    everything is accepted.
+    """
+    accepted = _parse_accept(accept) or [('*/*', 1.0)]
+    best, best_quality = None, 0.0
+
+    for mimetype in offered:
+        matches = [(_specificity(pattern, mimetype), quality) for pattern, quality in accepted]
+        matches = [match for match in matches if match[0] is not None]
+        if not matches:
+            continue
+
+        quality = max(matches)[1]
+        if quality > best_quality:
+            best, best_quality = mimetype, quality
+
+    return best
+
+
+class PlacesASGIApp(object):
+    """
+    ASGI app serving the same /ping, /api/place (plain, streamed and paged),
+    /api/place/batch and /api/photo responses as the flask app, on the asyncio
+    search engine.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+        if config['CACHE_BACKEND'] == 'redis':
+            self.cache = RedisCache(config['CACHE_REDIS_URL'])
+        else:
+            self.cache = SimpleCache()
+
+        self.snapshot = None
+        if config.get('CACHE_SNAPSHOT_PATH') and isinstance(self.cache, SimpleCache):
+            self.snapshot = CacheSnapshot(path.join(config['BASE_DIR'], config['CACHE_SNAPSHOT_PATH']),
+                                          exclude_prefixes=[CURSOR_KEY_PREFIX])
+            self.cache.restore(self.snapshot)
+
+        self.googleplaces = AsyncGooglePlaces(config['GOOGLE_PLACES_API_KEY'], config['ASYNC_MAX_CONNECTIONS'])
+        self.photo_manager = AsyncPhotoManager(self.googleplaces, self.cache)
+        self.engine = AsyncSearchEngine(config['HOSTNAME'], config.get('EXPOSE_PORT') or config['BIND_PORT'],
+                                        _ENDPOINT, self.googleplaces, self.cache,
+                                        search_concurrency=config['SEARCH_CONCURRENCY'],
+                                        tile_radius=config['SEARCH_TILE_RADIUS_METERS'],
+                                        max_tiles=config['SEARCH_MAX_TILES'],
+                                        search_cache_expire_secs=config['SEARCH_CACHE_EXPIRE_SECS'])
+        self.batch_query_limit = config['BATCH_QUERY_LIMIT']
+
+        #: Admission control, the same limits as the flask app
+        self.admission = {}
+        for name in ('place', 'photo'):
+            prefix = name.upper() + '_'
+            self.admission[name] = AsyncAdmissionController(name, config[prefix + 'MAX_CONCURRENCY'],
+                                                            config[prefix + 'MAX_QUEUE'],
+                                                            config['ADMISSION_QUEUE_TIMEOUT_SECS'],
+                                                            config['ADMISSION_RETRY_AFTER_SECS'])
+
+        self.routes = {
+            '/ping': {'GET': self.ping},
+            _ENDPOINT + '/place': {'GET': self.place},
+            _ENDPOINT + '/place/batch': {'POST': self.place_batch},
+            _ENDPOINT + '/photo': {'GET': self.photo},
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        request = _Request(scope, receive)
+        handlers = self.routes.get(request.path)
+
+        if handlers is None:
+            return await self.send_json(send, 404, _meta(404))
+
+        handler = handlers.get(request.method)
+        if handler is None:
+            return await self.send_json(send, 405, _meta(405), [(Header.allow.value, ', '.join(handlers))])
+
+        try:
+            await handler(request, send)
+        except _BadRequestError:
+            await self.send_json(send, 400, _meta(400))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await self.googleplaces.open()
+                # Started in the serving process rather than wherever the app was created
+                if self.snapshot is not None:
+                    start_snapshots(self.cache, self.snapshot, self.config['CACHE_SNAPSHOT_INTERVAL_SECS'])
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await self.googleplaces.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def send_start(send, status, content_type, extra_headers=()):
+        headers = [(b'content-type', content_type.encode('latin-1'))]
+        headers.extend((k.encode('latin-1'), v.encode('latin-1')) for k, v in extra_headers)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+    async def send_json(self, send, status, data, extra_headers=()):
+        body = json.dumps(data).encode('utf-8')
+        headers = [(Header.content_length.value, str(len(body)))]
+        headers.extend(extra_headers)
+        await self.send_start(send, status, MimeType.json.value, headers)
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def admit(self, name, send, respond, weight=1, bypass=False):
+        """
+        Send the response from respond() once the named controller admits the request,
+        or a 503 with a Retry-After when it is rejected. Requests that bypass, because
+        they can be answered from cache alone, skip the limiter.
+        """
+
+        if bypass:
+            return await respond()
+
+        controller = self.admission[name]
+        try:
+            slots = await controller.acquire(weight)
+        except AdmissionRejectedError:
+            LOG.warning('Rejected request over the admission limit - endpoint: {}'.format(name))
+            return await self.send_json(send, 503, _meta(503),
+                                        [(Header.retry_after.value, str(controller.retry_after_secs))])
+
+        try:
+            await respond()
+        finally:
+            await controller.release(slots)
+
+    async def ping(self, request, send):
+        """Health ping for load balancers and to see if server is up"""
+        await self.send_json(send, 200, _meta(200))
+
+    @auth_token_required
+    async def place(self, request, send):
+        cursor = request.arg('cursor')
+        if cursor is not None:
+            return await self.admit('place', send, lambda: self.place_next_page(send, cursor))
+
+        latitude = request.arg('latitude', float, required=True)
+        longitude = request.arg('longitude', float, required=True)
+        radius = request.arg('search_radius_meters', float, required=True)
+        stream = request.arg('stream', _boolean, default=False)
+        page = request.arg('page', _boolean, default=False)
+
+        if stream or _best_match(request.headers.get('accept', ''),
+                                 [MimeType.json.value, MimeType.ndjson.value]) == MimeType.ndjson.value:
+            respond = lambda: self.place_stream(send, latitude, longitude, radius)
+        elif page:
+            respond = lambda: self.place_page(send, latitude, longitude, radius)
+        else:
+            respond = lambda: self.place_search(send, latitude, longitude, radius)
+
+        bypass = not page and await self.engine.is_cached(latitude, longitude, radius)
+        await self.admit('place', send, respond, bypass=bypass)
+
+    async def place_search(self, send, latitude, longitude, radius):
+        venues = await self.engine.search(latitude, longitude, radius)
+        await self.send_json(send, 200, marshal(venues, PlacesResource.response_model))
+
+    async def place_page(self, send, latitude, longitude, radius):
+        venues, cursor = await self.engine.search_page(latitude, longitude, radius)
+        await self.send_json(send, 200, marshal(venues, PlacesResource.response_model), _cursor_headers(cursor))
+
+    async def place_next_page(self, send, cursor):
+        try:
+            venues, cursor = await self.engine.search_next_page(cursor)
+        except NoSuchCursorError as e:
+            raise _BadRequestError('cursor') from e
+
+        await self.send_json(send, 200, marshal(venues, PlacesResource.response_model), _cursor_headers(cursor))
+
+    async def place_stream(self, send, latitude, longitude, radius):
+        await self.send_start(send, 200, MimeType.ndjson.value)
+
+        venues = []
+        async for venue in self.engine.search_as_completed(latitude, longitude, radius):
+            venues.append(venue)
+            record = dict(type='venue', venue=marshal(venue, PlacesResource.stream_response_model))
+            await send({'type': 'http.response.body', 'body': _ndjson(record), 'more_body': True})
+
+        ranked = self.engine.rank(latitude, longitude, venues)
+        record = dict(type='order', uuids=[v['uuid'] for v in ranked])
+        await send({'type': 'http.response.body', 'body': _ndjson(record)})
+
+    @auth_token_required
+    async def place_batch(self, request, send):
+        body = await request.json()
+        queries = body.get('queries') if isinstance(body, dict) else None
+
+        if not isinstance(queries, list) or len(queries) > self.batch_query_limit:
+            raise _BadRequestError('queries')
+
+        try:
+            queries = [tuple(float(q[field]) for field in PlacesBatchResource.query_fields) for q in queries]
+        except (KeyError, TypeError, ValueError) as e:
+            raise _BadRequestError('queries') from e
+
+        async def respond():
+            results = await self.engine.batch_search(queries)
+            await self.send_json(send, 200, marshal({'results': results}, PlacesBatchResource.response_model))
+
+        #: Weighted by the number of queries, like the flask batch resource
+        await self.admit('place', send, respond, weight=max(len(queries), 1))
+
+    @auth_token_required
+    async def photo(self, request, send):
+        photo_uuid = request.arg('uuid', required=True)
+        bypass = await self.photo_manager.is_cached(photo_uuid)
+        await self.admit('photo', send, lambda: self.photo_response(send, photo_uuid), bypass=bypass)
+
+    async def photo_response(self, send, photo_uuid):
+        try:
+            photo = await self.photo_manager.retrieve(photo_uuid)
+        except NoSuchPhotoError as e:
+            raise _BadRequestError('uuid') from e
+
+        await self.send_start(send, 200, MimeType.jpeg.value, [(Header.content_length.value, str(len(photo.bytes)))])
+        for chunk in photo.stream():
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def _cursor_headers(cursor):
+    return [(Header.next_cursor.value, cursor)] if cursor is not None else []
+
+
+def _meta(status_code):
+    return dict(meta=dict(status_code=status_code))
+
+
+def _ndjson(record):
+    return (json.dumps(record) + '\n').encode('utf-8')
+
+
+def create(root_path, config_name):
+    """The ASGI counterpart of app.create"""
+
+    config = app_config.for_context(config_name)
+    config['BASE_DIR'] = root_path
+    config['CONFIG_NAME'] = config_name
+    initialize_logging(None)
+
+    return PlacesASGIApp(config)
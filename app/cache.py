@@ -1,32 +1,356 @@
+import atexit
 import logging
+import mmap
+import os
+import pickle
+import signal
+import struct
+import threading
+import time
 from io import BytesIO
-from collections import defaultdict
 
 __all__ = [
     'BufferCacheEntry',
     'BufferStream',
+    'CacheSnapshot',
     'MissingCacheEntryError',
+    'RedisCache',
+    'SimpleCache',
+    'start_snapshots',
 ]
 
 LOG = logging.getLogger(__name__)
 KiB = 2 ** 10
+MiB = 2 ** 20
 
 
 class SimpleCache:
     """In memory cache in place of redis for this example"""
 
+    #: Sets between sweeps of the expired keys that were never read again
+    SWEEP_INTERVAL = 1024
+
     def __init__(self):
-        self._cache = defaultdict(lambda: None)
+        self._cache = {}
+        self._expires_at = {}
+        self._sets_since_sweep = 0
+        #: The search pool threads and the snapshot thread share the cache
+        self._lock = threading.RLock()
+
+        #: Entries restored from a snapshot are only unpickled on first get
+        self._restored = None
+        self._dirty = set()
 
     def get(self, key):
-        return self._cache[key]
+        with self._lock:
+            if key not in self._cache and self._restored is not None:
+                self._restore(key)
+
+            expires_at = self._expires_at.get(key)
+            if expires_at is not None and expires_at <= time.time():
+                self._evict(key)
+
+            return self._cache.get(key)
 
     def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._expires_at.pop(key, None)
+            self._dirty.add(key)
+
+            self._sets_since_sweep += 1
+            if self._sets_since_sweep >= self.SWEEP_INTERVAL:
+                self._sweep()
+
+        return True
+
+    def expire(self, key, secs):
+        """Like redis EXPIRE, the key is evicted secs from now"""
+        with self._lock:
+            if key in self._cache:
+                self._expires_at[key] = time.time() + secs
+                self._dirty.add(key)
+
+    def _evict(self, key):
+        self._cache.pop(key, None)
+        self._expires_at.pop(key, None)
+
+    def _restore(self, key):
+        try:
+            value, expires_at = self._restored.pop(key)
+        except KeyError:
+            return
+
         self._cache[key] = value
+        if expires_at is not None:
+            self._expires_at[key] = expires_at
+
+    def restore(self, snapshot):
+        """Warm start from a snapshot, entries are loaded lazily as they are asked for"""
+        restored = snapshot.index()
+        with self._lock:
+            self._restored = restored
+        LOG.info('Restored cache snapshot - path: {}; entries: {}'.format(snapshot.path, len(restored)))
+
+    def _entries(self, keys):
+        entries = []
+        for key in keys:
+            value = self._cache.get(key)
+            if value is not None:
+                entries.append((key, value, self._expires_at.get(key)))
+        return entries
+
+    def save(self, snapshot, compact=False):
+        """
+        Append the entries changed since the last save to the snapshot or, when
+        compacting, rewrite it with just the live entries. The entries are copied
+        under the lock, the file is written outside of it.
+        """
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+
+            if not compact:
+                entries = self._entries(dirty)
+            else:
+                entries = self._entries(list(self._cache))
+                restored = list(self._restored.raw_entries()) if self._restored is not None else ()
+
+        if not compact:
+            return snapshot.append(entries)
+
+        written = snapshot.write(entries, restored)
+        if self._restored is not None:
+            index = snapshot.index()
+            with self._lock:
+                self._restored = index
+
+        return written
+
+    def _sweep(self):
+        now = time.time()
+        for key in [k for k, expires_at in self._expires_at.items() if expires_at <= now]:
+            self._evict(key)
+        self._sets_since_sweep = 0
+
+
+class RedisCache(object):
+    """
+    Redis backed cache that the server workers share, values are pickled. It has
+    the same get/set/expire interface as SimpleCache.
+    """
+
+    def __init__(self, url):
+        # Optional dependency, only needed when the redis cache backend is configured
+        import redis
+
+        self._redis = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        value_bytes = self._redis.get(key)
+        return pickle.loads(value_bytes) if value_bytes is not None else None
+
+    def set(self, key, value):
+        """False when the value could not be pickled and was not stored"""
+        try:
+            value_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            LOG.warning('Not caching unpicklable value - key: {}; exception: {}'.format(key, e))
+            return False
+
+        self._redis.set(key, value_bytes)
+        return True
+
+    def expire(self, key, secs):
+        self._redis.expire(key, int(secs))
+
+
+class CacheSnapshot(object):
+    """
+    Append only file of cache entries. Each record is a header of the key length,
+    value length and expiry time (0 for none) followed by the pickled key and value.
+    The last record for a key wins, so saving only needs to append what changed.
+    """
+
+    HEADER = struct.Struct('>IId')
+
+    #: The snapshot is compacted once it grows past this many times its size at the
+    #: last compaction (or at startup), and not before it reaches MIN_COMPACT_BYTES
+    COMPACT_GROWTH = 2
+    MIN_COMPACT_BYTES = 4 * MiB
+
+    def __init__(self, path, exclude_prefixes=()):
+        self.path = path
+        #: Keys too short lived to be worth a warm start, they are never written
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self._lock = threading.Lock()
+        self._compacted_size = self.size()
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def needs_compaction(self):
+        return self.size() > max(self.COMPACT_GROWTH * self._compacted_size, self.MIN_COMPACT_BYTES)
+
+    def _record(self, key, value, expires_at):
+        try:
+            value_bytes = value if isinstance(value, _RawValue) else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            LOG.debug('Not snapshotting unpicklable cache entry - key: {}; exception: {}'.format(key, e))
+            return None
+
+        key_bytes = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        return self.HEADER.pack(len(key_bytes), len(value_bytes), expires_at or 0) + key_bytes + value_bytes
+
+    def _write_records(self, fo, entries):
+        count = 0
+        now = time.time()
+
+        for key, value, expires_at in entries:
+            if expires_at is not None and expires_at <= now:
+                continue
+            if isinstance(key, str) and key.startswith(self.exclude_prefixes):
+                continue
+
+            record = self._record(key, value, expires_at)
+            if record is not None:
+                fo.write(record)
+                count += 1
+
+        return count
+
+    def append(self, entries):
+        with self._lock, open(self.path, 'ab') as fo:
+            count = self._write_records(fo, entries)
+
+        LOG.debug('Appended to cache snapshot - path: {}; entries: {}'.format(self.path, count))
+        return count
+
+    def write(self, *entry_iterables):
+        """Replace the snapshot with the entries, the first value seen for a key wins"""
+        seen = set()
+
+        def unseen():
+            for entries in entry_iterables:
+                for key, value, expires_at in entries:
+                    if key not in seen:
+                        seen.add(key)
+                        yield key, value, expires_at
+
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'wb') as fo:
+                count = self._write_records(fo, unseen())
+            os.replace(tmp_path, self.path)
+            self._compacted_size = self.size()
+
+        LOG.debug('Wrote cache snapshot - path: {}; entries: {}'.format(self.path, count))
+        return count
+
+    def index(self):
+        return SnapshotIndex(self.path, self.HEADER)
+
+
+class _RawValue(bytes):
+    """Pickled value bytes copied between snapshots without unpickling them"""
+
+
+class SnapshotIndex(object):
+    """
+    Memory mapped snapshot with the offsets of the live entries. Reading it only
+    touches the headers and keys, values are unpickled when they are popped.
+    """
+
+    def __init__(self, path, header):
+        self._offsets = {}
+        self._mmap = None
+
+        try:
+            with open(path, 'rb') as fi:
+                if os.fstat(fi.fileno()).st_size:
+                    self._mmap = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+
+        if self._mmap is not None:
+            self._scan(header)
+
+    def _scan(self, header):
+        now = time.time()
+        size = len(self._mmap)
+        offset = 0
+
+        while offset + header.size <= size:
+            key_len, value_len, expires_at = header.unpack_from(self._mmap, offset)
+            key_offset = offset + header.size
+            value_offset = key_offset + key_len
+            offset = value_offset + value_len
+
+            if offset > size:
+                LOG.warning('Truncated cache snapshot record at offset {}'.format(key_offset - header.size))
+                break
+
+            key = pickle.loads(self._mmap[key_offset:value_offset])
+            if expires_at and expires_at <= now:
+                self._offsets.pop(key, None)
+            else:
+                self._offsets[key] = (value_offset, value_len, expires_at or None)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def pop(self, key):
+        """(value, expires_at) for the key, raises KeyError when missing or expired"""
+        value_offset, value_len, expires_at = self._offsets.pop(key)
+        if expires_at is not None and expires_at <= time.time():
+            raise KeyError(key)
+
+        return pickle.loads(self._mmap[value_offset:value_offset + value_len]), expires_at
+
+    def raw_entries(self):
+        for key, (value_offset, value_len, expires_at) in list(self._offsets.items()):
+            yield key, _RawValue(self._mmap[value_offset:value_offset + value_len]), expires_at
+
+
+def start_snapshots(cache, snapshot, interval_secs):
+    """
+    Keep the snapshot of a cache restored from it up to date every interval_secs,
+    compacting it whenever it has grown too far, and compact it on shutdown (exit or
+    SIGTERM). Only the one process serving from the cache may run this.
+    """
+
+    def run():
+        while True:
+            time.sleep(interval_secs)
+            try:
+                cache.save(snapshot, compact=snapshot.needs_compaction)
+            except Exception:
+                LOG.exception('Failed to save cache snapshot - path: {}'.format(snapshot.path))
+
+    threading.Thread(target=run, name='cache-snapshot', daemon=True).start()
+    atexit.register(cache.save, snapshot, compact=True)
+
+    # atexit does not run when the process is terminated by the default SIGTERM
+    # handler. Signal handlers can only be set from the main thread.
+    if threading.current_thread() is threading.main_thread():
+        previous_handler = signal.getsignal(signal.SIGTERM)
+
+        def on_sigterm(signum, frame):
+            atexit.unregister(cache.save)
+            cache.save(snapshot, compact=True)
+
+            if callable(previous_handler):
+                return previous_handler(signum, frame)
+
+            signal.signal(signal.SIGTERM, previous_handler)
+            os.kill(os.getpid(), signum)
+
+        signal.signal(signal.SIGTERM, on_sigterm)
 
-    def expire(self, key, time):
-        # Noop for example
-        pass
 
 class MissingCacheEntryError(Exception):
     pass
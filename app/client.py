@@ -0,0 +1,37 @@
+import functools
+import logging
+
+__all__ = [
+    'LazyGooglePlacesClient',
+]
+
+LOG = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _client_for(api_key):
+    # rekt generates the client classes from the api spec on import, which is
+    # a good part of the boot time. Deferred to here and done once per process.
+    from rekt_googleplaces import GooglePlacesClient
+
+    LOG.debug('Generating GooglePlacesClient')
+    return GooglePlacesClient(api_key=api_key)
+
+
+class LazyGooglePlacesClient(object):
+    """
+    Stands in for the GooglePlacesClient, which is only generated on the first
+    upstream call (or `load`) and then shared by every app in the process.
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._client = None
+
+    def load(self):
+        if self._client is None:
+            self._client = _client_for(self.api_key)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
@@ -1,7 +1,7 @@
-from pathlib import Path, PurePath
+import sys
+from pathlib import Path
 
 import yaml
-from pkg_resources import resource_filename
 
 from .util import filterdict
 
@@ -10,24 +10,23 @@ __all__ = (
     'for_context'
 )
 
+#: The libyaml loader is several times faster when it is available
+_YAMLLoader = getattr(yaml, 'CLoader', yaml.Loader)
+
 
 def load(name, module_name=__name__, paths=None):
     """
-    Uses package info magic to find the resource file located in the specs
-    submodule.
+    Find the yaml resource file that sits alongside the named module, or in
+    the first of paths when given.
     """
     if paths is None:
-        try:
-            paths = __path__
-        except NameError:
-            paths = [str(Path(__file__).parent)]
+        paths = [str(Path(sys.modules[module_name].__file__).parent)]
 
-    config_path = Path(next(iter(paths)))
-    config_path = config_path / PurePath(resource_filename(module_name, name + '.yaml'))
+    config_path = Path(next(iter(paths))) / (name + '.yaml')
 
     with config_path.open('rb') as fi:
         file_bytes = fi.read()
-        config = yaml.load(file_bytes.decode('utf-8'))
+        config = yaml.load(file_bytes.decode('utf-8'), Loader=_YAMLLoader)
 
     return config
 
@@ -1,7 +1,5 @@
 import logging
 
-from rekt_googleplaces.errors import GoogleAPIError
-
 from .cache import BufferCacheEntry, BufferStream, MissingCacheEntryError
 
 __all__ = [
@@ -42,6 +40,8 @@ class GooglePlacesPhotoManager(object):
         return PhotoCacheEntry(self.cache, key).photo
 
     def _retrieve_from_googleplaces(self, key):
+        from rekt_googleplaces.errors import GoogleAPIError
+
         try:
             response = self.gp.get_photo2(photoreference=key, maxwidth=PHOTO_MAX_WIDTH)
         except GoogleAPIError as e:
@@ -0,0 +1,149 @@
+import logging
+import math
+from collections import namedtuple
+
+__all__ = [
+    'SearchArea',
+    'place_location',
+    'roots',
+    'enclosing_area',
+    'tiles',
+    'grid_tiles',
+]
+
+LOG = logging.getLogger(__name__)
+
+#: Decimal places kept for search centers, ~1m at the equator. Queries that
+#: only differ past this are the same upstream search.
+COORDINATE_PRECISION = 5
+METERS_PER_DEGREE_LATITUDE = 111320.0
+#: The largest radius upstream will search
+MAX_TILE_RADIUS_METERS = 50000
+
+
+class SearchArea(namedtuple('SearchArea', ['latitude', 'longitude', 'radius'])):
+    """A circular geographic search area, radius in meters"""
+
+    __slots__ = ()
+
+    @classmethod
+    def normalized(cls, latitude, longitude, radius, precision=COORDINATE_PRECISION):
+        return cls(round(latitude, precision), round(longitude, precision), float(radius))
+
+    @property
+    def center(self):
+        return self.latitude, self.longitude
+
+    def contains(self, other):
+        """True when the other area lies entirely within this one"""
+        return _meters_between(self.center, other.center) + other.radius <= self.radius
+
+    def contains_place(self, place):
+        location = place_location(place)
+        if location is None:
+            return False
+
+        return _meters_between(self.center, location) <= self.radius
+
+
+def _meters_between(a, b):
+    # geopy is slow to import and only needed once requests are being served
+    from geopy.distance import great_circle
+    return great_circle(a, b).meters
+
+
+def place_location(place):
+    """(lat, lon) of a google places result or None when it has no geometry"""
+    location = place.get('geometry', {}).get('location', {})
+
+    try:
+        return location['lat'], location['lng']
+    except KeyError:
+        return None
+
+
+def roots(areas):
+    """The areas that are not enclosed by any of the other areas"""
+    return [a for a in areas if not any(o != a and o.contains(a) for o in areas)]
+
+
+def enclosing_area(area, candidates):
+    """The smallest candidate area that encloses area or None"""
+    enclosing = [c for c in candidates if c.contains(area)]
+    return min(enclosing, key=lambda c: c.radius, default=None)
+
+
+def tiles(area, tile_radius, max_tiles):
+    """
+    Cover the area with circular tiles of tile_radius. The tiles are the circles
+    around the cells of a fixed global grid, so the same tile (and its cached
+    results) comes up for every area that overlaps it. The tile radius is doubled
+    until the area is covered by at most max_tiles tiles, up to the largest radius
+    upstream will search. Past that only the max_tiles tiles nearest the center of
+    the area are kept.
+    """
+
+    tile_radius = min(tile_radius, MAX_TILE_RADIUS_METERS)
+    if area.radius <= tile_radius:
+        return [area]
+
+    # Skip the doublings that can not bring the area down to max_tiles, each tile
+    # covers no more than a cell of 2 * tile_radius ** 2
+    doublings = math.log2(area.radius * math.sqrt(math.pi / (2 * max_tiles)) / tile_radius)
+    if doublings > 1:
+        tile_radius = min(tile_radius * 2 ** math.floor(doublings), MAX_TILE_RADIUS_METERS)
+
+    covering = _grid_tiles(area, tile_radius)
+    while len(covering) > max_tiles and tile_radius < MAX_TILE_RADIUS_METERS:
+        tile_radius = min(tile_radius * 2, MAX_TILE_RADIUS_METERS)
+        covering = _grid_tiles(area, tile_radius)
+
+    if len(covering) > max_tiles:
+        LOG.warning('Search area is too big to cover - area: {}; tiles: {}'.format(area, len(covering)))
+        covering = sorted(covering, key=lambda tile: _meters_between(area.center, tile.center))[:max_tiles]
+
+    LOG.debug('Tiled search area - area: {}; tile_radius: {}; tiles: {}'.format(area, tile_radius, len(covering)))
+    return covering
+
+
+def grid_tiles(area, tile_radius):
+    """
+    The tiles of the fixed grid that cover the area, even when the area fits in a
+    single tile, so that nearby small areas can share the searches of their tiles.
+    """
+    return _grid_tiles(area, min(tile_radius, MAX_TILE_RADIUS_METERS))
+
+
+def _grid_tiles(area, tile_radius):
+    # Square cells with a side of r * sqrt(2) fit exactly in a circle of radius r
+    cell_meters = tile_radius * math.sqrt(2)
+    lat_step = cell_meters / METERS_PER_DEGREE_LATITUDE
+    lat_span = area.radius / METERS_PER_DEGREE_LATITUDE
+
+    covering = []
+
+    for row in range(math.floor((area.latitude - lat_span) / lat_step),
+                     math.floor((area.latitude + lat_span) / lat_step) + 1):
+        south, north = row * lat_step, (row + 1) * lat_step
+        if south >= 90 or north <= -90:
+            continue
+
+        # A degree of longitude is longest nearest the equator, size the cells there
+        # so that every cell of the row fits inside its tile. The area is widest in
+        # degrees at the edge of the row farthest from the equator.
+        equatorward = 0.0 if south < 0 < north else min(abs(south), abs(north))
+        poleward = min(max(abs(south), abs(north)), 89.9)
+        lon_step = lat_step / math.cos(math.radians(equatorward))
+        lon_span = min(area.radius / (METERS_PER_DEGREE_LATITUDE * math.cos(math.radians(poleward))), 180)
+
+        for col in range(math.floor((area.longitude - lon_span) / lon_step),
+                         math.floor((area.longitude + lon_span) / lon_step) + 1):
+            west, east = col * lon_step, (col + 1) * lon_step
+
+            nearest = (min(max(area.latitude, south), north), min(max(area.longitude, west), east))
+            if _meters_between(area.center, nearest) > area.radius:
+                continue
+
+            covering.append(SearchArea.normalized((south + north) / 2, (west + east) / 2, tile_radius))
+
+    return covering
@@ -1,22 +1,42 @@
 import concurrent.futures
+import copy
 import logging
 import sys
+import threading
+import time
+import uuid
 from datetime import timedelta
 from enum import Enum
 from functools import partial
 from urllib.parse import urlunparse
 
-from geopy.distance import great_circle
-from rekt_googlecore.client import paginate_responses
-from rekt_googlecore.errors import InvalidRequestError, ZeroResultsError
-
 from .photo import PHOTO_MAX_WIDTH
+from .planner import SearchArea, enclosing_area, grid_tiles, roots, tiles
 from .util import URL, Scheme
 
 LOG = logging.getLogger(__name__)
 SEARCH_LIMIT = 10
 DEFAULT_PHOTO_URL = None #https://s3.amazonaws.com/###-multimedia-artifact-repo/generic.jpg'
-PHOTO_CACHE_ENTRY_EXPIRE_SECS = timedelta(days=7).seconds
+PHOTO_CACHE_ENTRY_EXPIRE_SECS = int(timedelta(days=7).total_seconds())
+DEFAULT_SEARCH_CONCURRENCY = 8
+
+#: Searches bigger than a tile are split into concurrent tile searches
+DEFAULT_TILE_RADIUS_METERS = 1000
+DEFAULT_MAX_TILES = 19
+#: All of the pages upstream will give for a single tile
+TILE_RESULT_LIMIT = 60
+DEFAULT_SEARCH_CACHE_EXPIRE_SECS = int(timedelta(hours=1).total_seconds())
+
+#: How long the places and page tokens behind a search cursor are kept
+CURSOR_EXPIRE_SECS = int(timedelta(minutes=10).total_seconds())
+CURSOR_KEY_PREFIX = 'cursor:'
+#: A fresh next_page_token is not valid for a couple of seconds upstream
+PAGE_TOKEN_ATTEMPTS = 3
+PAGE_TOKEN_DELAY_SECS = 2
+
+
+class NoSuchCursorError(Exception):
+    pass
 
 
 def _sort_alphabetically(v):
@@ -24,6 +44,8 @@ def _sort_alphabetically(v):
 
 
 def _sort_by_distance(location, v):
+    from geopy.distance import great_circle
+
     try:
         lat = v['latitude']
         lon = v['longitude']
@@ -49,23 +71,53 @@ class VenueSort(Enum):
     distance = ('distance', _sort_by_distance)
 
 
-def generate_results(call, max_results=SEARCH_LIMIT):
+def format_location(lat, lon):
+    return '{},{}'.format(lat, lon)
 
-    responses = paginate_responses(call)
-    result_count = 0
-    for response in responses:
-        LOG.debug('Google Places results - results_count: {}'.format(len(response.results)))
 
-        for result in response.results:
-            result_count += 1
-            yield result
+class PlaceResult(dict):
+    """
+    A google places result copied into plain dicts and lists, with attribute
+    access to its keys like the rekt responses, so that it pickles anywhere.
+    """
 
-            if result_count >= max_results:
-                return
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
 
+    @classmethod
+    def copy_of(cls, result):
+        return cls(_plain(result))
 
-def format_location(lat, lon):
-    return '{},{}'.format(lat, lon)
+
+def _plain(value):
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def places_cache_key(area, max_results):
+    return 'places:{}:{}:{}:{}'.format(area.latitude, area.longitude, area.radius, max_results)
+
+
+def merge_tile_places(area, tile_places):
+    """The unique places of the tiles that are within the area"""
+    places_by_uuid = {}
+
+    for places in tile_places:
+        for place in places:
+            if area.contains_place(place):
+                places_by_uuid.setdefault(place.place_id, place)
+
+    return list(places_by_uuid.values())
+
+
+def details_cache_key(place_id):
+    return 'details:' + place_id
 
 
 def add_details_to_place(place, details_by_place_id):
@@ -96,15 +148,164 @@ def place_to_venue_response(place):
     return venue_data
 
 
+def _get_sorter(latitude, longitude, sort_by):
+    sort_type = VenueSort[sort_by]
+
+    if sort_type == VenueSort.distance:
+        sorter = partial(sort_type.sorter, (latitude, longitude))
+    else:
+        sorter = sort_type.sorter
+
+    return sorter
+
+
+def rank_venues(latitude, longitude, venues, sort_by='distance'):
+    """Order the venues for the response and trim them to the search limit"""
+
+    sorter = _get_sorter(latitude, longitude, sort_by)
+    return sorted(venues, key=sorter)[:SEARCH_LIMIT]
+
+
+def rank_places(latitude, longitude, places, sort_by='distance'):
+    """Order search result places (no details needed) the same way as `rank_venues` does venues"""
+
+    sorter = _get_sorter(latitude, longitude, sort_by)
+    return sorted(places, key=lambda p: sorter(place_to_venue_response(p)))
+
+
+def venue_photo_url(venue, hostname, port, loc):
+    """The url of the photo /api/photo serves for the venue or None when it has none wide enough"""
+
+    photo_url = None
+    photos = venue.get('photos', [])
+    photos = [p for p in photos if p.get('width', 0) >= PHOTO_MAX_WIDTH]
+
+    for photo in photos:
+
+        photo_ref = photo.get('photo_reference', None)
+
+        if photo_ref:
+            photo_url = urlunparse(URL(
+                scheme=Scheme.http,
+                netloc='{}:{}'.format(hostname, port),
+                path=loc + '/photo',
+                query='uuid=' + photo_ref)
+            )
+
+    return photo_url
+
+
+def to_response_venue(place, details_by_place_id):
+    """The response venue, all but its photo url, of the place with its details"""
+
+    # The place is shared through the search cache, the details go on a copy
+    place = add_details_to_place(PlaceResult(place), details_by_place_id)
+    return place_to_venue_response(place)
+
+
+def plan_small_areas(areas, tile_radius):
+    """
+    Split the small areas (no bigger than a tile) of a batch into those searched on
+    their own and those planned onto the tile grid, with their tiles. Areas that
+    overlap the same tiles, like circles along a route, are grouped and a group is
+    planned onto its tiles when that takes fewer searches than one for each area.
+    """
+
+    tiles_by_area = {area: grid_tiles(area, tile_radius) for area in areas}
+
+    # Group the areas that (transitively) share a tile
+    group_by_tile = {}
+    groups = []
+    for area, area_tiles in tiles_by_area.items():
+        merged = {id(g): g for g in (group_by_tile.get(tile) for tile in area_tiles) if g is not None}
+        group = {'areas': [area], 'tiles': set(area_tiles)}
+        for other in merged.values():
+            group['areas'].extend(other['areas'])
+            group['tiles'].update(other['tiles'])
+            groups.remove(other)
+        groups.append(group)
+        for tile in group['tiles']:
+            group_by_tile[tile] = group
+
+    separate = set()
+    tiled = {}
+    for group in groups:
+        if len(group['tiles']) < len(group['areas']):
+            tiled.update((area, tiles_by_area[area]) for area in group['areas'])
+        else:
+            separate.update(group['areas'])
+
+    return separate, tiled
+
+
+def unique_places(places_by_area):
+    """The places of all of the areas by place id, each place once"""
+    places_by_uuid = {}
+
+    for places in places_by_area.values():
+        for place in places:
+            places_by_uuid.setdefault(place.place_id, place)
+
+    return places_by_uuid
+
+
+def batch_results(areas, places_by_area, venues_by_uuid, sort_by='distance'):
+    """The ranked venues for each of the batch areas, in order"""
+    results = []
+
+    for area in areas:
+        uuids = {p.place_id for p in places_by_area[area]}
+        venues = [venues_by_uuid[uuid] for uuid in uuids]
+        results.append(rank_venues(area.latitude, area.longitude, venues, sort_by))
+
+    return results
+
+
+def caches_first_places(places, page_token, completed):
+    """
+    True when the first page of a search holds what a search for SEARCH_LIMIT places
+    would have found, so `search_page` can cache them for `search`.
+    """
+    return bool(places) and completed and (len(places) >= SEARCH_LIMIT or not page_token)
+
+
+def cursor_state(latitude, longitude, sort_by, places, page_tokens):
+    """The state behind a cursor, only plain data so that it pickles for any cache backend"""
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'sort_by': sort_by,
+        'places': places,
+        'page_tokens': [(tuple(area), token) for area, token in page_tokens],
+    }
+
+
 class SearchEngine(object):
     """The Places Search Engine"""
 
-    def __init__(self, hostname, port, loc, googleplaces, cache):
+    def __init__(self, hostname, port, loc, googleplaces, cache,
+                 search_concurrency=DEFAULT_SEARCH_CONCURRENCY,
+                 tile_radius=DEFAULT_TILE_RADIUS_METERS,
+                 max_tiles=DEFAULT_MAX_TILES,
+                 search_cache_expire_secs=DEFAULT_SEARCH_CACHE_EXPIRE_SECS):
         self.hostname = hostname
         self.port = port
         self.loc = loc
         self.googleplaces = googleplaces
         self.cache = cache
+        self.search_concurrency = search_concurrency
+        #: Bounds the searches upstream for the whole process rather than per request,
+        #: it is shared by the copies of the engine made with `with_client`
+        self._upstream_searches = threading.BoundedSemaphore(search_concurrency)
+        self.tile_radius = tile_radius
+        self.max_tiles = max_tiles
+        self.search_cache_expire_secs = search_cache_expire_secs
+
+    def with_client(self, googleplaces):
+        """Same engine (and cache) calling upstream through another client"""
+        engine = copy.copy(self)
+        engine.googleplaces = googleplaces
+        return engine
 
     def photo_url_for_venue(self, venue, default_url=None):
 
@@ -114,21 +315,7 @@ class SearchEngine(object):
         if photo_url:
             return photo_url
 
-        photo_url = None
-        photos = venue.get('photos', [])
-        photos = [p for p in photos if p.get('width', 0) >= PHOTO_MAX_WIDTH]
-
-        for photo in photos:
-
-            photo_ref = photo.get('photo_reference', None)
-
-            if photo_ref:
-                photo_url = urlunparse(URL(
-                    scheme=Scheme.http,
-                    netloc='{}:{}'.format(self.hostname, self.port),
-                    path=self.loc + '/photo',
-                    query='uuid=' + photo_ref)
-                )
+        photo_url = venue_photo_url(venue, self.hostname, self.port, self.loc)
 
         if photo_url:
             self.cache.set(photo_url_key, photo_url)
@@ -143,111 +330,357 @@ class SearchEngine(object):
 
     def _get_places(self, latitude, longitude, radius, max_results):
         """Manage getting the aggregated places based on geographic search criteria"""
+        return self._search_places(latitude, longitude, radius, max_results)[0]
 
-        get_places_call = partial(self.googleplaces.get_places,
-                                  location=format_location(latitude, longitude),
-                                  radius=radius)
+    def _search_places(self, latitude, longitude, radius, max_results):
+        """
+        Same as `_get_places` along with whether the search completed, as opposed to
+        being cut short by an upstream error with only some (or none) of the places.
+        Each page takes its own turn at the upstream searches, so the waits for a page
+        token to become valid do not hold one.
+        """
 
+        area = SearchArea(latitude, longitude, radius)
         places = []
+        page_token = None
 
-        try:
-            for place in generate_results(get_places_call, max_results):
-                places.append(place)
+        while len(places) < max_results:
+            page_places, page_token, completed = self._search_page(area, page_token)
+            places.extend(page_places)
 
-        except InvalidRequestError as e:
-            # Generally this means the token did not become valid
-            # quickly enough.
-            LOG.exception("Invalid request, possibly the token is not yet active?")
-        except ZeroResultsError as e:
-            # Sometimes it happens and in this case there isn't much
-            # we can do about it.
-            LOG.exception("No Results for search")
+            if not completed:
+                return places[:max_results], False
+            if page_token is None:
+                break
 
-        return places
+        return places[:max_results], True
 
-    def _get_details_for_places(self, places):
+    def _get_cached_places(self, area, max_results):
         """
+        Places for the area from the search cache, searching upstream on a miss, and
+        whether the search completed. Only completed searches are cached.
         """
 
-        details_by_place_id = {}
-        futures = []
+        key = places_cache_key(area, max_results)
+        places = self.cache.get(key)
+        if places is not None:
+            return places, True
 
-        for place in places:
-            future = self.googleplaces.async_get_details(placeid=place.place_id)
-            futures.append(future)
+        places, completed = self._search_places(area.latitude, area.longitude, area.radius, max_results)
+        if completed:
+            self.cache.set(key, places)
+            self.cache.expire(key, self.search_cache_expire_secs)
 
-        for details_response in concurrent.futures.as_completed(futures):
-            if details_response.exception() is not None:
-                LOG.error('Exception in getting details. exception: {}'.format(details_response.exception()))
-                continue
+        return places, completed
 
-            details = details_response.result().result
-            details_by_place_id[details.place_id] = details
+    def _get_area_places(self, latitude, longitude, radius, sort_by='distance'):
+        """
+        Ranked places for the search area. An area bigger than a tile is covered by
+        tiles which are searched concurrently, with cached tiles skipping upstream, and
+        their places merged so the area is ranked as a whole rather than from the
+        one sample upstream gives for a dense area.
+        """
 
-        return details_by_place_id
+        area = SearchArea(latitude, longitude, radius)
 
-    def _new_venues_with_details(self, places_missing_details):
+        if radius <= self.tile_radius:
+            places, _ = self._get_cached_places(area, SEARCH_LIMIT)
+            return rank_places(latitude, longitude, places, sort_by)
 
-        details_by_place_id = self._get_details_for_places(places_missing_details)
+        area_tiles = tiles(area, self.tile_radius, self.max_tiles)
+        get_tile_places = lambda tile: self._get_cached_places(tile, TILE_RESULT_LIMIT)[0]
 
-        # Curry some functions to make comprehensions more clear
-        add_details_to = partial(add_details_to_place, details_by_place_id=details_by_place_id)
-        places_with_details = [add_details_to(place) for place in places_missing_details]
-        new_venues = [place_to_venue_response(place) for place in places_with_details]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.search_concurrency, len(area_tiles))) as pool:
+            places = merge_tile_places(area, pool.map(get_tile_places, area_tiles))
 
-        return new_venues
+        return rank_places(latitude, longitude, places, sort_by)
 
-    def _places_to_response_venues(self, places_by_uuid):
+    def is_cached(self, latitude, longitude, radius, sort_by='distance'):
+        """True when `search` can be answered from the cache without any upstream calls"""
 
-        details_by_place_id = {}
-        futures = []
+        area = SearchArea(latitude, longitude, radius)
+
+        if radius <= self.tile_radius:
+            places = self.cache.get(places_cache_key(area, SEARCH_LIMIT))
+            if places is None:
+                return False
+        else:
+            tile_places = [self.cache.get(places_cache_key(tile, TILE_RESULT_LIMIT))
+                           for tile in tiles(area, self.tile_radius, self.max_tiles)]
+            if any(p is None for p in tile_places):
+                return False
+            places = merge_tile_places(area, tile_places)
+
+        places = rank_places(latitude, longitude, places, sort_by)[:SEARCH_LIMIT]
+        return all(self.cache.get(details_cache_key(p.place_id)) is not None for p in places)
+
+    def _venues_as_completed(self, places_by_uuid):
+        """
+        Yield the response venues, photo url included, in the order that their
+        details calls complete.
+        """
+
+        uuids_by_future = {}
+        cached_details_by_place_id = {}
+
+        for uuid in places_by_uuid:
+            details = self.cache.get(details_cache_key(uuid))
+            if details is not None:
+                cached_details_by_place_id[uuid] = details
+                continue
 
-        for uuid, place in places_by_uuid.items():
             # Use the async call functionality on the Rekt GooglePlacesClient
             # to fetch all of the details in parallel.
             future = self.googleplaces.async_get_details(placeid=uuid)
-            futures.append(future)
-
-        for details_response in concurrent.futures.as_completed(futures):
-            if details_response.exception() is not None:
-                LOG.error('Exception in getting details. exception: {}'.format(details_response.exception()))
-                continue
+            uuids_by_future[future] = uuid
 
-            details = details_response.result().result
-            details_by_place_id[details.place_id] = details
+        for uuid in cached_details_by_place_id:
+            yield self._to_response_venue(places_by_uuid[uuid], cached_details_by_place_id)
 
-        add_details_to = partial(add_details_to_place, details_by_place_id=details_by_place_id)
-        places_with_details = [add_details_to(place) for place in places_by_uuid.values()]
-        new_venues = [place_to_venue_response(place) for place in places_with_details]
+        for details_response in concurrent.futures.as_completed(uuids_by_future):
+            uuid = uuids_by_future[details_response]
+            details_by_place_id = {}
 
-        photo_url_for = partial(self.photo_url_for_venue, default_url=DEFAULT_PHOTO_URL)
+            if details_response.exception() is not None:
+                LOG.error('Exception in getting details. exception: {}'.format(details_response.exception()))
+            else:
+                details_by_place_id[uuid] = PlaceResult.copy_of(details_response.result().result)
+                self.cache.set(details_cache_key(uuid), details_by_place_id[uuid])
+                self.cache.expire(details_cache_key(uuid), self.search_cache_expire_secs)
 
-        for venue in new_venues:
-            venue.update({'photo_url' : photo_url_for(venue) })
+            yield self._to_response_venue(places_by_uuid[uuid], details_by_place_id)
 
-        return new_venues
+    def _to_response_venue(self, place, details_by_place_id):
+        venue = to_response_venue(place, details_by_place_id)
+        venue.update({'photo_url': self.photo_url_for_venue(venue, default_url=DEFAULT_PHOTO_URL)})
 
-    @staticmethod
-    def _get_sorter(latitude, longitude, sort_by):
-        sort_type = VenueSort[sort_by]
+        return venue
 
-        if sort_type == VenueSort.distance:
-            sorter = partial(sort_type.sorter, (latitude, longitude))
-        else:
-            sorter = sort_type.sorter
+    def _places_to_response_venues(self, places_by_uuid):
+        return list(self._venues_as_completed(places_by_uuid))
 
-        return sorter
+    def rank(self, latitude, longitude, venues, sort_by='distance'):
+        """Order the venues for the response and trim them to the search limit"""
+        return rank_venues(latitude, longitude, venues, sort_by)
 
     def search(self, latitude, longitude, radius, sort_by='distance'):
         """Search by distance, no name"""
 
-        places = self._get_places(latitude, longitude, radius, max_results=SEARCH_LIMIT)
+        places = self._get_area_places(latitude, longitude, radius, sort_by)[:SEARCH_LIMIT]
         places_by_uuid = {p.place_id: p for p in places}
 
         venues = self._places_to_response_venues(places_by_uuid)
 
-        sorter = self._get_sorter(latitude, longitude, sort_by)
-        response_venues = sorted(venues, key=sorter)[:SEARCH_LIMIT]
+        return self.rank(latitude, longitude, venues, sort_by)
+
+    def search_as_completed(self, latitude, longitude, radius):
+        """
+        Same search as `search` but yields each venue as soon as its details are
+        available. Use `rank` on the collected venues for the final order.
+        """
+
+        places = self._get_area_places(latitude, longitude, radius)[:SEARCH_LIMIT]
+        places_by_uuid = {p.place_id: p for p in places}
+
+        return self._venues_as_completed(places_by_uuid)
+
+    def _search_areas(self, areas):
+        """
+        Get the places for each of the unique areas. An area enclosed by another area
+        of the batch waits on that search and, when it completed with less than the
+        search limit (that is all there is), is answered by filtering its places
+        instead of making its own upstream search. Areas that only partly overlap
+        each make their own search.
+        """
+
+        places_by_area = {}
+        exhaustive = []
+        unresolved = set(areas)
+        upstream_searches = 0
+
+        get_places = lambda area: self._get_cached_places(area, SEARCH_LIMIT)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.search_concurrency) as pool:
+            while unresolved:
+                searches = roots(unresolved)
+                upstream_searches += len(searches)
+
+                for area, (places, completed) in zip(searches, pool.map(get_places, searches)):
+                    places_by_area[area] = places
+                    if completed and len(places) < SEARCH_LIMIT:
+                        exhaustive.append(area)
+
+                unresolved.difference_update(searches)
+
+                for area in list(unresolved):
+                    enclosing = enclosing_area(area, exhaustive)
+                    if enclosing is None:
+                        continue
+
+                    places_by_area[area] = [p for p in places_by_area[enclosing] if area.contains_place(p)]
+                    unresolved.remove(area)
+
+        LOG.debug('Batch search - areas: {}; upstream searches: {}'.format(len(places_by_area), upstream_searches))
+
+        return places_by_area
+
+    def _search_tiled_areas(self, tiles_by_area, sort_by='distance'):
+        """
+        Get the ranked places for each of the areas from the tiles covering them. The
+        tiles are searched once each however many of the areas they overlap.
+        """
+
+        unique_tiles = list({tile for area_tiles in tiles_by_area.values() for tile in area_tiles})
+        if not unique_tiles:
+            return {}
+
+        get_tile_places = lambda tile: self._get_cached_places(tile, TILE_RESULT_LIMIT)[0]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.search_concurrency, len(unique_tiles))) as pool:
+            places_by_tile = dict(zip(unique_tiles, pool.map(get_tile_places, unique_tiles)))
+
+        LOG.debug('Batch tiled search - areas: {}; tiles: {}'.format(len(tiles_by_area), len(unique_tiles)))
+
+        places_by_area = {}
+        for area, area_tiles in tiles_by_area.items():
+            places = merge_tile_places(area, [places_by_tile[tile] for tile in area_tiles])
+            places_by_area[area] = rank_places(area.latitude, area.longitude, places, sort_by)[:SEARCH_LIMIT]
+
+        return places_by_area
+
+    def batch_search(self, queries, sort_by='distance'):
+        """
+        Search for many (latitude, longitude, radius) queries at once. Queries bigger
+        than a tile share the searches of the tiles they overlap. Smaller queries that
+        overlap, like circles along a route, are planned onto the tiles too when that
+        takes fewer searches, otherwise they share a search when they are identical or
+        one encloses the other. The details for each place are only fetched once.
+        Returns the venue list for each query in order.
+        """
+
+        areas = [SearchArea.normalized(*query) for query in queries]
+
+        separate, tiles_by_area = plan_small_areas({a for a in areas if a.radius <= self.tile_radius}, self.tile_radius)
+        tiles_by_area.update((a, tiles(a, self.tile_radius, self.max_tiles))
+                             for a in set(areas) if a.radius > self.tile_radius)
+
+        places_by_area = self._search_areas(separate)
+        places_by_area.update(self._search_tiled_areas(tiles_by_area, sort_by))
+
+        venues = self._venues_as_completed(unique_places(places_by_area))
+        return batch_results(areas, places_by_area, {venue['uuid']: venue for venue in venues}, sort_by)
+
+    def _get_page(self, area, page_token=None):
+        """Get a single page of places for the area and the token for the page after it"""
+        return self._search_page(area, page_token)[:2]
+
+    def _search_page(self, area, page_token=None):
+        """Same as `_get_page` along with whether the page came back, no results included"""
+        from rekt_googlecore.errors import InvalidRequestError, ZeroResultsError
+
+        get_places_call = partial(self.googleplaces.get_places,
+                                  location=format_location(area.latitude, area.longitude),
+                                  radius=area.radius)
+        if page_token is not None:
+            get_places_call = partial(get_places_call, pagetoken=page_token)
+
+        for attempt in range(1, PAGE_TOKEN_ATTEMPTS + 1):
+            try:
+                with self._upstream_searches:
+                    response = get_places_call()
+
+                LOG.debug('Google Places results - results_count: {}'.format(len(response.results)))
+                # Plain copies so the places pickle for the redis cache
+                places = [PlaceResult.copy_of(result) for result in response.results]
+                return places, getattr(response, 'next_page_token', None), True
+
+            except InvalidRequestError as e:
+                # Generally this means the token did not become valid quickly enough
+                if page_token is None or attempt == PAGE_TOKEN_ATTEMPTS:
+                    LOG.exception("Invalid request, possibly the token is not yet active?")
+                    break
+                time.sleep(PAGE_TOKEN_DELAY_SECS)
+
+            except ZeroResultsError as e:
+                # Sometimes it happens and in this case there isn't much we can do about it
+                LOG.exception("No Results for search")
+                return [], None, True
+
+        return [], None, False
+
+    def _save_cursor(self, state):
+        """Keep the state behind the next page and hand back the opaque cursor for it"""
+
+        if not state['places'] and not state['page_tokens']:
+            return None
+
+        cursor = uuid.uuid4().hex
+        key = CURSOR_KEY_PREFIX + cursor
+
+        if not self.cache.set(key, state):
+            LOG.error('Could not store the search cursor state, no cursor returned - key: {}'.format(key))
+            return None
+        self.cache.expire(key, CURSOR_EXPIRE_SECS)
+
+        return cursor
+
+    def _cursor_page(self, state, places):
+        venues = self._places_to_response_venues({p.place_id: p for p in places})
+        venues = self.rank(state['latitude'], state['longitude'], venues, state['sort_by'])
+        return venues, self._save_cursor(state)
+
+    def search_page(self, latitude, longitude, radius, sort_by='distance'):
+        """
+        Same results as `search` along with a cursor (or None when there is nothing
+        left) for `search_next_page` to continue through the rest of the places.
+        """
+
+        area = SearchArea(latitude, longitude, radius)
+
+        if radius > self.tile_radius:
+            # Tiles are searched through all of their pages up front
+            places, page_tokens = self._get_area_places(latitude, longitude, radius, sort_by), []
+        else:
+            # The page token is only had from upstream, the first places of the page are
+            # what `search` caches for the area so they are cached here too
+            places, page_token, completed = self._search_page(area)
+            page_tokens = [(area, page_token)] if page_token else []
+
+            first_places = places[:SEARCH_LIMIT]
+            if caches_first_places(places, page_token, completed):
+                key = places_cache_key(area, SEARCH_LIMIT)
+                self.cache.set(key, first_places)
+                self.cache.expire(key, self.search_cache_expire_secs)
+
+            places = rank_places(latitude, longitude, first_places, sort_by) + places[SEARCH_LIMIT:]
+
+        state = cursor_state(latitude, longitude, sort_by, places[SEARCH_LIMIT:], page_tokens)
+        return self._cursor_page(state, places[:SEARCH_LIMIT])
+
+    def search_next_page(self, cursor):
+        """
+        The next page of a search started with `search_page`. Upstream pages are only
+        fetched once the places kept for the cursor run short of a page, and the page
+        is the best ranked of the places that have not been returned yet.
+        """
+
+        state = self.cache.get(CURSOR_KEY_PREFIX + cursor)
+        if state is None:
+            raise NoSuchCursorError()
+
+        places = list(state['places'])
+        page_tokens = list(state['page_tokens'])
+
+        while len(places) < SEARCH_LIMIT and page_tokens:
+            area, page_token = page_tokens.pop(0)
+            area = SearchArea(*area)
+            page_places, next_page_token = self._get_page(area, page_token)
+            places.extend(page_places)
+            if next_page_token:
+                page_tokens.append((area, next_page_token))
 
-        return response_venues
+        places = rank_places(state['latitude'], state['longitude'], places, state['sort_by'])
 
+        next_state = cursor_state(state['latitude'], state['longitude'], state['sort_by'], places[SEARCH_LIMIT:],
+                                  page_tokens)
+        return self._cursor_page(next_state, places[:SEARCH_LIMIT])
@@ -0,0 +1,77 @@
+import logging
+import multiprocessing
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+from .api import start_background_tasks
+
+__all__ = [
+    'ProductionServer',
+    'serve',
+]
+
+LOG = logging.getLogger(__name__)
+
+
+class ProductionServer(BaseApplication):
+    """
+    Gunicorn master that preforks eventlet workers from an already created app.
+
+    SIGHUP gracefully replaces the workers, SIGTTIN/SIGTTOU add and remove workers
+    and SIGUSR2 starts a new master on the new code for zero downtime deploys.
+    """
+
+    def __init__(self, instance, options):
+        self.instance = instance
+        self.options = options
+        BaseApplication.__init__(self)
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.instance
+
+
+def _server_options(config):
+    workers = config.get('SERVER_WORKERS') or multiprocessing.cpu_count()
+
+    return {
+        'bind': '0.0.0.0:{}'.format(config['BIND_PORT']),
+        'workers': workers,
+        'worker_class': 'eventlet',
+        'worker_connections': config['SERVER_WORKER_CONNECTIONS'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT_SECS'],
+        # The app is created once in the master and shared copy-on-write by the workers
+        'preload_app': True,
+    }
+
+
+def serve(instance):
+    options = _server_options(instance.config)
+
+    if options['workers'] > 1 and instance.config['CACHE_BACKEND'] != 'redis':
+        if instance.extensions['MyRestService'].snapshot is not None:
+            sys.exit('The {} workers would each save their own cache over the same CACHE_SNAPSHOT_PATH, '
+                     'set SERVER_WORKERS to 1 or CACHE_BACKEND to redis'.format(options['workers']))
+
+        LOG.warning('Each of the {} workers will have its own in process cache, '
+                    'set CACHE_BACKEND to redis to share it'.format(options['workers']))
+
+    # The app is created in the master, its background threads would not survive
+    # the fork. A single worker runs them itself, many workers would each spend
+    # the warming budget so they are left to a `run.py <config> warm --interval`.
+    if options['workers'] == 1:
+        options['post_fork'] = lambda server, worker: start_background_tasks(instance)
+    elif instance.config.get('WARM_INTERVAL_SECS'):
+        LOG.warning('WARM_INTERVAL_SECS is not run by {} workers, '
+                    'run `run.py <config> warm --interval` alongside them'.format(options['workers']))
+
+    # Generate the rekt client in the master so the workers share it rather
+    # than each generating their own on the first request.
+    instance.extensions['MyRestService'].googleplaces.load()
+
+    LOG.info('Starting production server - {}'.format(options))
+    ProductionServer(instance, options).run()
@@ -1,8 +1,9 @@
 from urllib.parse import ParseResult, urlparse
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import Enum
 import functools
-
-from flask import jsonify
+import time
 
 __all__ = [
     'URL',
@@ -12,12 +13,14 @@ __all__ = [
     'Header',
     'generic_response',
     'ident',
-    'filterdict'
+    'filterdict',
+    'StartupTimes',
 ]
 
 
 @functools.lru_cache(16)
 def generic_response(status_code):
+    from flask import jsonify
     return jsonify(meta=dict(status_code=status_code))
 
 
@@ -31,6 +34,26 @@ def filterdict(d, func=ident):
     return {k: v for k, v in d.items() if func(v)}
 
 
+class StartupTimes(OrderedDict):
+    """Seconds spent in each named phase of creating the app"""
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(self.values())
+
+    def __str__(self):
+        phases = ('{}: {:.1f}ms'.format(name, secs * 1000) for name, secs in self.items())
+        return '{}; total: {:.1f}ms'.format('; '.join(phases), self.total * 1000)
+
+
 class URL(ParseResult):
     def __new__(cls, scheme='', netloc='', path='', params='', query='', fragment=''):
         return super(URL, cls).__new__(cls, scheme, netloc, path, params, query, fragment)
@@ -70,7 +93,12 @@ class MimeType(str, Enum):
         return obj
 
     jpeg = (MediaType.image, 'jpeg')
+    json = (MediaType.application, 'json')
+    ndjson = (MediaType.application, 'x-ndjson')
 
 
 class Header(str, Enum):
+    allow = 'Allow'
     content_length = 'Content-Length'
+    next_cursor = 'X-Next-Cursor'
+    retry_after = 'Retry-After'
@@ -0,0 +1,161 @@
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+
+from .photo import GooglePlacesPhotoManager, NoSuchPhotoError
+
+__all__ = [
+    'UpstreamBudgetExhaustedError',
+    'BudgetedGooglePlaces',
+    'ManifestEntry',
+    'WarmReport',
+    'load_manifest',
+    'warm',
+    'start_scheduled_warming',
+]
+
+LOG = logging.getLogger(__name__)
+DEFAULT_WARM_CONCURRENCY = 4
+
+
+class UpstreamBudgetExhaustedError(Exception):
+    pass
+
+
+class BudgetedGooglePlaces(object):
+    """
+    Stands in for the GooglePlacesClient and counts every upstream call against
+    a budget, calls past the budget raise UpstreamBudgetExhaustedError.
+    """
+
+    UPSTREAM_CALLS = ('get_places', 'get_details', 'async_get_details', 'get_photo2')
+
+    def __init__(self, googleplaces, budget=None):
+        self._googleplaces = googleplaces
+        self._lock = threading.Lock()
+        self.budget = budget
+        self.used = 0
+
+    @property
+    def exhausted(self):
+        return self.budget is not None and self.used >= self.budget
+
+    def _spend(self):
+        with self._lock:
+            if self.exhausted:
+                raise UpstreamBudgetExhaustedError()
+            self.used += 1
+
+    def __getattr__(self, name):
+        attr = getattr(self._googleplaces, name)
+        if name not in self.UPSTREAM_CALLS:
+            return attr
+
+        def call(*args, **kwargs):
+            self._spend()
+            return attr(*args, **kwargs)
+
+        return call
+
+
+class ManifestEntry(namedtuple('ManifestEntry', ['latitude', 'longitude', 'search_radius_meters', 'weight'])):
+    __slots__ = ()
+
+
+WarmReport = namedtuple('WarmReport', ['searches', 'skipped', 'failed', 'venues', 'photos', 'upstream_calls', 'budget'])
+
+
+def load_manifest(manifest_path):
+    """
+    Read a YAML list of hot locations, hottest first:
+
+        - {latitude: 47.6, longitude: -122.3, search_radius_meters: 1000, weight: 10}
+    """
+
+    with open(manifest_path, 'rb') as fi:
+        entries = yaml.safe_load(fi.read().decode('utf-8')) or []
+
+    manifest = [ManifestEntry(float(e['latitude']), float(e['longitude']),
+                              float(e['search_radius_meters']), float(e.get('weight', 1)))
+                for e in entries]
+
+    return sorted(manifest, key=lambda e: e.weight, reverse=True)
+
+
+def _photo_ref(photo_url):
+    return parse_qs(urlparse(photo_url).query).get('uuid', [None])[0]
+
+
+def warm(engine, manifest, budget=None, concurrency=DEFAULT_WARM_CONCURRENCY):
+    """
+    Run the manifest searches through the engine, the same `search` that answers a
+    plain /api/place, and prefetch their photos so the search, details and photo
+    caches are populated. The hottest entries are warmed
+    first and the rest are skipped once the upstream budget is spent.
+    """
+
+    googleplaces = BudgetedGooglePlaces(engine.googleplaces, budget)
+    engine = engine.with_client(googleplaces)
+    photo_manager = GooglePlacesPhotoManager(googleplaces, engine.cache)
+
+    counts = {'searches': 0, 'skipped': 0, 'failed': 0, 'venues': 0, 'photos': 0}
+    counts_lock = threading.Lock()
+
+    def count(**increments):
+        with counts_lock:
+            for name, n in increments.items():
+                counts[name] += n
+
+    def warm_entry(entry):
+        if googleplaces.exhausted:
+            return count(skipped=1)
+
+        try:
+            venues = engine.search(entry.latitude, entry.longitude, entry.search_radius_meters)
+            count(searches=1, venues=len(venues))
+
+            for photo_url in (v['photo_url'] for v in venues if v.get('photo_url')):
+                try:
+                    photo_manager.retrieve(_photo_ref(photo_url))
+                    count(photos=1)
+                except NoSuchPhotoError:
+                    LOG.debug('No photo to warm - url: {}'.format(photo_url))
+
+        except UpstreamBudgetExhaustedError:
+            LOG.info('Upstream budget exhausted warming - entry: {}'.format(entry))
+            count(skipped=1)
+        except Exception:
+            # One bad entry or upstream error does not lose the rest of the run
+            LOG.exception('Failed warming - entry: {}'.format(entry))
+            count(failed=1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(warm_entry, manifest))
+
+    report = WarmReport(upstream_calls=googleplaces.used, budget=budget, **counts)
+    LOG.info('Warmed cache - {}'.format(report))
+
+    return report
+
+
+def start_scheduled_warming(engine, manifest_path, interval_secs, budget=None,
+                            concurrency=DEFAULT_WARM_CONCURRENCY):
+    """Warm the cache from the manifest now and then every interval_secs in the background"""
+
+    def run():
+        while True:
+            try:
+                warm(engine, load_manifest(manifest_path), budget, concurrency)
+            except Exception:
+                LOG.exception('Failed scheduled cache warming - manifest: {}'.format(manifest_path))
+            time.sleep(interval_secs)
+
+    thread = threading.Thread(target=run, name='cache-warming', daemon=True)
+    thread.start()
+
+    return thread
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+asgi.py
+==============
+
+This file is the asgi entry point of the webservice code, serving the
+same API as wsgi.py on the asyncio search engine. Point any ASGI server
+at `asgi:application` or run this file to serve it with uvicorn.
+"""
+import sys
+from os import path, environ
+
+# Ensure that app is on the python module search path
+# by including the directory that holds this file.
+_root_app_path = path.dirname(path.abspath(__file__))
+sys.path.append(_root_app_path)
+
+_config_name = environ.get('RUNTIME_CONFIG', 'debug')
+
+import app.asgi
+application = app.asgi.create(_root_app_path, _config_name)
+
+
+def main():
+    import uvicorn
+
+    print('RUNTIME_CONFIG={}'.format(_config_name))
+    uvicorn.run(application, host='0.0.0.0', port=application.config.get('BIND_PORT'))
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import sys
 from os import path
+import time
 import timeit
 
 import requests
@@ -18,12 +19,16 @@ except IndexError:
     config_name = 'debug'
 
 import app
+from app import api
 instance = app.create(root_app_path, config_name=config_name)
 
 manager = Manager(instance)
 
 @manager.command
 def server():
+    # Generate the rekt client now rather than on the first request
+    instance.extensions['MyRestService'].googleplaces.load()
+    api.start_background_tasks(instance)
     instance.run(port=instance.config.get('BIND_PORT'))
 
 @manager.command
@@ -49,5 +54,86 @@ def example():
     print('Difference: {:.2f}%'.format(100.0 * (time_1 - time_2) / time_1))
 
 
+@manager.option('-m', '--manifest', dest='manifest', default=None,
+                help='YAML hot location manifest, defaults to WARM_MANIFEST_PATH')
+@manager.option('-b', '--budget', dest='budget', type=int, default=None,
+                help='Max upstream calls, defaults to WARM_UPSTREAM_BUDGET')
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=None,
+                help='Manifest entries warmed at once, defaults to WARM_CONCURRENCY')
+@manager.option('-i', '--interval', dest='interval', type=int, default=None,
+                help='Keep re-warming every interval seconds')
+def warm(manifest, budget, concurrency, interval):
+    """Pre-populate the search, details and photo caches from a hot location manifest"""
+    from app.warm import load_manifest, warm as warm_cache
+
+    config = instance.config
+    manifest = manifest or config.get('WARM_MANIFEST_PATH')
+    if manifest is None:
+        sys.exit('No manifest given, pass --manifest or set WARM_MANIFEST_PATH')
+    if config['CACHE_BACKEND'] != 'redis' and not config.get('CACHE_SNAPSHOT_PATH'):
+        sys.exit('Nothing would keep the warmed cache, set CACHE_BACKEND to redis or set CACHE_SNAPSHOT_PATH')
+
+    manifest = path.join(root_app_path, manifest)
+    budget = budget if budget is not None else config.get('WARM_UPSTREAM_BUDGET')
+    concurrency = concurrency or config['WARM_CONCURRENCY']
+    service = instance.extensions['MyRestService']
+    engine = service.engine
+
+    while True:
+        report = warm_cache(engine, load_manifest(manifest), budget, concurrency)
+        print('Searches warmed:', report.searches)
+        print('Searches skipped:', report.skipped)
+        print('Searches failed:', report.failed)
+        print('Venues:', report.venues)
+        print('Photos:', report.photos)
+        print('Upstream calls: {} of {}'.format(report.upstream_calls, report.budget or 'unlimited'))
+
+        if service.snapshot is not None:
+            service.cache.save(service.snapshot, compact=True)
+
+        if interval is None:
+            break
+        time.sleep(interval)
+
+
+#: Cold starts the app in a fresh interpreter and prints its startup times as json
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.append({root!r})
+import app
+imported = time.perf_counter()
+instance = app.create({root!r}, config_name={config!r})
+times = dict(import_app=imported - start, **instance.extensions['startup_times'])
+if {eager!r}:
+    with instance.extensions['startup_times'].phase('client'):
+        instance.extensions['MyRestService'].googleplaces.load()
+    times['client'] = instance.extensions['startup_times']['client']
+times['total'] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+
+@manager.option('-n', '--runs', dest='runs', type=int, default=5, help='Cold starts to take the median of')
+@manager.option('-e', '--eager', dest='eager', action='store_true', default=False,
+                help='Also generate the rekt client, as the first request (or the prefork master) would')
+def startup_benchmark(runs, eager):
+    """Benchmark cold starts of the app, with the time of each startup phase"""
+    import json
+    import statistics
+    import subprocess
+
+    probe = _STARTUP_PROBE.format(root=root_app_path, config=config_name, eager=eager)
+    samples = []
+
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', probe], stderr=subprocess.DEVNULL)
+        samples.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+
+    print('Startup over {} cold starts (median ms):'.format(runs))
+    for phase in samples[0]:
+        print('  {:<12} {:8.1f}'.format(phase, 1000 * statistics.median(s[phase] for s in samples)))
+
+
 if __name__ == "__main__":
     manager.run()
@@ -0,0 +1,162 @@
+import concurrent.futures
+import sys
+import threading
+from os import path
+
+import pytest
+
+# The app package is imported from the repository root, as run.py and wsgi.py do
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+#: Center of the stub places, laid out on a grid about 100m apart
+ORIGIN = (40.7128, -74.006)
+GRID_STEP_DEGREES = 0.0009
+GRID_SIZE = 15
+PAGE_SIZE = 20
+
+
+class StubResult(dict):
+    """Like the rekt responses, a dict with attribute access to its keys"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(name) from e
+
+
+def _response_class(name):
+    # Like the rekt response classes, made at runtime so they do not pickle
+    return type(name, (StubResult,), {})
+
+
+PlacesResult = _response_class('GetPlacesResult')
+DetailsResult = _response_class('GetDetailsResult')
+
+
+def _stub_place(row, col):
+    return StubResult(
+        place_id='p{}-{}'.format(row, col),
+        name='Place {} {}'.format(row, col),
+        geometry={'location': {'lat': round(ORIGIN[0] + (row - GRID_SIZE // 2) * GRID_STEP_DEGREES, 6),
+                               'lng': round(ORIGIN[1] + (col - GRID_SIZE // 2) * GRID_STEP_DEGREES, 6)}},
+    )
+
+
+class StubGooglePlaces(object):
+    """
+    Stands in for the rekt GooglePlacesClient over a fixed grid of places, in
+    pages of PAGE_SIZE with the same page token flow as upstream.
+    """
+
+    def __init__(self, places=None):
+        self.places = places if places is not None else [_stub_place(r, c)
+                                                         for r in range(GRID_SIZE) for c in range(GRID_SIZE)]
+        self.places_calls = []
+        self.details_calls = []
+        self.fail_page_tokens = False
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def _places_page(self, location, radius, pagetoken):
+        """The page of places for the search, None when there are no results"""
+        from app.planner import SearchArea
+
+        with self._lock:
+            self.places_calls.append((location, radius, pagetoken))
+
+        latitude, longitude = (float(c) for c in location.split(','))
+        area = SearchArea(latitude, longitude, radius)
+        found = [p for p in self.places if area.contains_place(p)]
+        if not found:
+            return None
+
+        offset = int(pagetoken) if pagetoken is not None else 0
+        response = StubResult(results=[PlacesResult(p) for p in found[offset:offset + PAGE_SIZE]])
+        # Upstream gives no more than 3 pages for a search
+        if offset + PAGE_SIZE < min(len(found), 3 * PAGE_SIZE):
+            response['next_page_token'] = str(offset + PAGE_SIZE)
+
+        return response
+
+    def _details(self, placeid):
+        with self._lock:
+            self.details_calls.append(placeid)
+
+        return StubResult(result=DetailsResult(place_id=placeid, formatted_address='{} Street'.format(placeid)))
+
+    def get_places(self, location, radius, pagetoken=None):
+        from rekt_googlecore.errors import InvalidRequestError, ZeroResultsError
+
+        if pagetoken is not None and self.fail_page_tokens:
+            raise InvalidRequestError()
+
+        response = self._places_page(location, radius, pagetoken)
+        if response is None:
+            raise ZeroResultsError()
+
+        return response
+
+    def get_details(self, placeid):
+        return self._details(placeid)
+
+    def async_get_details(self, placeid):
+        return self._pool.submit(self.get_details, placeid)
+
+
+class AsyncStubGooglePlaces(StubGooglePlaces):
+    """Stands in for the AsyncGooglePlaces client over the same places"""
+
+    def __init__(self, places=None):
+        StubGooglePlaces.__init__(self, places)
+        #: Raised for the first page of a search in place of a response
+        self.fail_first_pages_with = None
+
+    async def get_places(self, location, radius, pagetoken=None):
+        from app.aiosearch import AsyncGoogleAPIError
+
+        if pagetoken is None and self.fail_first_pages_with is not None:
+            self.places_calls.append((location, radius, pagetoken))
+            raise self.fail_first_pages_with
+        if pagetoken is not None and self.fail_page_tokens:
+            raise AsyncGoogleAPIError('INVALID_REQUEST')
+
+        response = self._places_page(location, radius, pagetoken)
+        if response is None:
+            raise AsyncGoogleAPIError('ZERO_RESULTS')
+
+        return response
+
+    async def get_details(self, placeid):
+        return self._details(placeid)
+
+
+@pytest.fixture
+def googleplaces():
+    pytest.importorskip('geopy')
+    pytest.importorskip('rekt_googlecore')
+    return StubGooglePlaces()
+
+
+@pytest.fixture
+def engine(googleplaces):
+    from app.cache import SimpleCache
+    from app.search import SearchEngine
+
+    return SearchEngine('localhost', 5000, '/api', googleplaces, SimpleCache(), tile_radius=500, max_tiles=9)
+
+
+@pytest.fixture
+def async_googleplaces():
+    pytest.importorskip('geopy')
+    pytest.importorskip('aiohttp')
+    return AsyncStubGooglePlaces()
+
+
+@pytest.fixture
+def async_engine(async_googleplaces):
+    from app.aiosearch import AsyncSearchEngine
+    from app.cache import SimpleCache
+
+    return AsyncSearchEngine('localhost', 5000, '/api', async_googleplaces, SimpleCache(), tile_radius=500,
+                             max_tiles=9)
@@ -0,0 +1,177 @@
+import threading
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from app.admission import Admission, AdmissionController, AdmissionRejectedError
+
+
+def _controller(max_concurrency=1, max_queue=1, queue_timeout_secs=0.05):
+    return AdmissionController('place', max_concurrency, max_queue, queue_timeout_secs, retry_after_secs=7)
+
+
+def test_rejects_when_the_queue_is_full():
+    controller = _controller(max_queue=0)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejectedError):
+        controller.acquire()
+
+    controller.release()
+    controller.acquire()
+
+
+def test_rejects_after_waiting_in_the_queue():
+    controller = _controller(max_queue=1)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejectedError):
+        controller.acquire()
+
+
+def test_queued_request_is_admitted_on_release():
+    controller = _controller(queue_timeout_secs=5)
+    controller.acquire()
+
+    admitted = threading.Event()
+
+    def queued():
+        controller.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=queued)
+    thread.start()
+    controller.release()
+    thread.join()
+
+    assert admitted.is_set()
+
+
+@pytest.fixture
+def limited_app():
+    admission = Admission()
+    controller = _controller(max_queue=0)
+    admission.register(controller)
+    app = flask.Flask(__name__)
+    cached = []
+
+    @app.route('/plain')
+    @admission.limit('place', bypass=lambda: bool(cached))
+    def plain():
+        return flask.jsonify(ok=True)
+
+    @app.route('/stream')
+    @admission.limit('place')
+    def stream():
+        return flask.Response((chunk for chunk in ('a', 'b')), content_type='text/plain')
+
+    return app, controller, cached
+
+
+def test_rejected_request_is_a_503_with_retry_after(limited_app):
+    app, controller, _ = limited_app
+    controller.acquire()
+
+    response = app.test_client().get('/plain')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+    assert response.get_json() == {'meta': {'status_code': 503}}
+
+
+def test_cached_request_bypasses_the_limit(limited_app):
+    app, controller, cached = limited_app
+    controller.acquire()
+    cached.append(True)
+
+    assert app.test_client().get('/plain').status_code == 200
+
+
+def test_slot_is_released_after_the_response(limited_app):
+    app, controller, _ = limited_app
+    client = app.test_client()
+
+    assert client.get('/plain').status_code == 200
+    assert client.get('/plain').status_code == 200
+
+
+def test_streamed_response_holds_its_slot_until_closed(limited_app):
+    app, controller, _ = limited_app
+    client = app.test_client()
+
+    response = client.get('/stream', buffered=False)
+    assert client.get('/plain').status_code == 503
+
+    assert b''.join(response.response) == b'ab'
+    response.close()
+
+    assert client.get('/plain').status_code == 200
+
+
+def test_weighted_request_takes_that_many_slots():
+    controller = _controller(max_concurrency=4, max_queue=0)
+
+    assert controller.acquire(3) == 3
+    controller.acquire()
+    with pytest.raises(AdmissionRejectedError):
+        controller.acquire()
+
+    controller.release(3)
+    # Capped at the concurrency limit so that it can be admitted at all
+    with pytest.raises(AdmissionRejectedError):
+        controller.acquire(100)
+    controller.release()
+    assert controller.acquire(100) == 4
+
+
+def _async_controller(max_queue=1, queue_timeout_secs=0.05):
+    from app.admission import AsyncAdmissionController
+
+    return AsyncAdmissionController('place', 2, max_queue, queue_timeout_secs, retry_after_secs=7)
+
+
+def test_async_rejects_when_the_queue_is_full():
+    import asyncio
+
+    async def run():
+        controller = _async_controller(max_queue=0)
+        await controller.acquire(weight=2)
+
+        with pytest.raises(AdmissionRejectedError):
+            await controller.acquire()
+
+        await controller.release(2)
+        await controller.acquire()
+
+    asyncio.run(run())
+
+
+def test_async_queued_request_is_admitted_on_release():
+    import asyncio
+
+    async def run():
+        controller = _async_controller(queue_timeout_secs=5)
+        await controller.acquire(weight=5)
+
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert not queued.done()
+
+        await controller.release(2)
+        assert await queued == 1
+
+    asyncio.run(run())
+
+
+def test_async_rejects_after_waiting_in_the_queue():
+    import asyncio
+
+    async def run():
+        controller = _async_controller()
+        await controller.acquire(weight=2)
+
+        with pytest.raises(AdmissionRejectedError):
+            await controller.acquire()
+
+    asyncio.run(run())
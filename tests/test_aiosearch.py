@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import ORIGIN
+
+
+def _uuids(venues):
+    return [v['uuid'] for v in venues]
+
+
+def test_search_cut_short_is_not_cached(async_engine, async_googleplaces, monkeypatch):
+    from app.planner import SearchArea
+
+    monkeypatch.setattr('app.aiosearch.PAGE_TOKEN_DELAY_SECS', 0)
+    async_googleplaces.fail_page_tokens = True
+    tile = SearchArea(ORIGIN[0], ORIGIN[1], 500)
+
+    places, completed = asyncio.run(async_engine._get_cached_places(tile, 60))
+
+    assert not completed
+    assert len(places) == 20
+    assert not async_engine.cache.cache._cache
+
+
+def test_client_errors_are_not_completed(async_engine, async_googleplaces):
+    import aiohttp
+
+    async_googleplaces.fail_first_pages_with = aiohttp.ClientConnectionError()
+
+    assert asyncio.run(async_engine.search(ORIGIN[0], ORIGIN[1], 300)) == []
+    assert not async_engine.cache.cache._cache
+
+
+def test_search_is_the_same_as_the_sync_engine(async_engine):
+    from app.search import SearchEngine
+    from conftest import StubGooglePlaces
+
+    pytest.importorskip('rekt_googlecore')
+    engine = SearchEngine('localhost', 5000, '/api', StubGooglePlaces(), async_engine.cache.cache,
+                          tile_radius=500, max_tiles=9)
+
+    for radius in (300, 1200):
+        venues = asyncio.run(async_engine.search(ORIGIN[0], ORIGIN[1], radius))
+        assert set(_uuids(venues)) == set(_uuids(engine.search(ORIGIN[0], ORIGIN[1], radius)))
+
+
+def test_cursor_pages_through_all_of_the_places(async_engine, async_googleplaces):
+
+    async def page_through():
+        venues, cursor = await async_engine.search_page(ORIGIN[0], ORIGIN[1], 450)
+        pages = [venues]
+        while cursor is not None:
+            venues, cursor = await async_engine.search_next_page(cursor)
+            pages.append(venues)
+        return pages
+
+    pages = asyncio.run(page_through())
+    seen = [uuid for venues in pages for uuid in _uuids(venues)]
+
+    assert len(pages) == 6
+    assert len(seen) == len(set(seen)) == 60
+    assert [call[2] for call in async_googleplaces.places_calls] == [None, '20', '40']
+
+
+def test_unknown_cursor(async_engine):
+    from app.search import NoSuchCursorError
+
+    with pytest.raises(NoSuchCursorError):
+        asyncio.run(async_engine.search_next_page('missing'))
+
+
+def test_is_cached_when_search_makes_no_upstream_calls(async_engine, async_googleplaces):
+    for radius in (450, 1200):
+        assert not asyncio.run(async_engine.is_cached(ORIGIN[0], ORIGIN[1], radius))
+        asyncio.run(async_engine.search(ORIGIN[0], ORIGIN[1], radius))
+        assert asyncio.run(async_engine.is_cached(ORIGIN[0], ORIGIN[1], radius))
+
+
+def test_batch_identical_queries_share_a_search(async_engine, async_googleplaces):
+    results = asyncio.run(async_engine.batch_search([(ORIGIN[0], ORIGIN[1], 300)] * 3))
+
+    assert len(results) == 3
+    assert _uuids(results[0]) == _uuids(results[1]) == _uuids(results[2])
+    assert len([call for call in async_googleplaces.places_calls if call[2] is None]) == 1
+    assert len(async_googleplaces.details_calls) == len(set(async_googleplaces.details_calls)) == 10
+
+
+def test_batch_route_queries_share_tiles(async_engine, async_googleplaces):
+    route = [(ORIGIN[0] + i * 0.001, ORIGIN[1], 300) for i in range(6)]
+
+    results = asyncio.run(async_engine.batch_search(route))
+
+    assert all(len(venues) == 10 for venues in results)
+    assert len([call for call in async_googleplaces.places_calls if call[2] is None]) < len(route)
+
+
+def test_cache_over_the_network_runs_in_the_executor():
+    from app.aiosearch import AsyncCache
+
+    class NetworkCache(object):
+        def __init__(self):
+            self.threads = []
+
+        def get(self, key):
+            self.threads.append(threading.current_thread())
+            return None
+
+    cache = NetworkCache()
+    asyncio.run(AsyncCache(cache).get('key'))
+
+    assert cache.threads and cache.threads[0] is not threading.main_thread()
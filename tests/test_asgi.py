@@ -0,0 +1,18 @@
+import pytest
+
+asgi = pytest.importorskip('app.asgi')
+
+OFFERED = ['application/json', 'application/x-ndjson']
+
+
+@pytest.mark.parametrize('accept, best', [
+    ('', 'application/json'),
+    ('*/*', 'application/json'),
+    ('application/x-ndjson', 'application/x-ndjson'),
+    ('application/x-ndjson;q=0.5, application/json', 'application/json'),
+    ('application/x-ndjson, application/json;q=0.9', 'application/x-ndjson'),
+    ('application/json;q=0, */*', 'application/x-ndjson'),
+    ('text/html', None),
+])
+def test_best_match(accept, best):
+    assert asgi._best_match(accept, OFFERED) == best
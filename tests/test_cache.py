@@ -0,0 +1,155 @@
+import os
+import time
+
+import pytest
+
+from app.cache import CacheSnapshot, SimpleCache
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return CacheSnapshot(str(tmp_path / 'cache.snapshot'), exclude_prefixes=['cursor:'])
+
+
+def _restored(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    return cache
+
+
+def test_expired_keys_are_evicted():
+    cache = SimpleCache()
+    cache.set('a', 1)
+    cache.expire('a', -1)
+
+    assert cache.get('a') is None
+    assert cache.get('missing') is None
+    assert not cache._cache
+
+
+def test_appended_entries_are_restored(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    cache.set('a', {'x': 1})
+    cache.set('b', b'bytes')
+    cache.expire('b', 60)
+    assert cache.save(snapshot) == 2
+
+    cache.set('a', {'x': 2})
+    assert cache.save(snapshot) == 1
+
+    restored = _restored(snapshot)
+    assert restored.get('a') == {'x': 2}
+    assert restored.get('b') == b'bytes'
+    # The remaining expiry is kept
+    assert 0 < restored._expires_at['b'] - time.time() <= 60
+
+
+def test_expired_entries_are_not_restored(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    cache.set('a', 1)
+    cache.expire('a', 0.05)
+    cache.set('b', 2)
+    cache.save(snapshot)
+
+    time.sleep(0.1)
+
+    restored = _restored(snapshot)
+    assert restored.get('a') is None
+    assert restored.get('b') == 2
+
+
+def test_short_lived_keys_are_not_written(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    cache.set('cursor:abc', {'places': []})
+    cache.set('a', 1)
+
+    assert cache.save(snapshot) == 1
+    assert _restored(snapshot).get('cursor:abc') is None
+
+
+def test_compaction_keeps_the_live_entries(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    for i in range(5):
+        cache.set('a', i)
+        cache.set('b', i)
+        cache.save(snapshot)
+    appended_size = snapshot.size()
+
+    # Entries restored but never read since are carried over without unpickling
+    restored = _restored(snapshot)
+    restored.set('c', 3)
+    restored.get('a')
+    assert restored.save(snapshot, compact=True) == 3
+    assert snapshot.size() < appended_size
+
+    compacted = _restored(snapshot)
+    assert (compacted.get('a'), compacted.get('b'), compacted.get('c')) == (4, 4, 3)
+
+
+def test_needs_compaction_after_growth(snapshot, monkeypatch):
+    monkeypatch.setattr(CacheSnapshot, 'MIN_COMPACT_BYTES', 0)
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    cache.set('a', 'x' * 100)
+    cache.save(snapshot, compact=True)
+    assert not snapshot.needs_compaction
+
+    for _ in range(3):
+        cache.set('a', 'x' * 100)
+        cache.save(snapshot)
+    assert snapshot.needs_compaction
+
+    cache.save(snapshot, compact=True)
+    assert not snapshot.needs_compaction
+
+
+def test_truncated_record_is_dropped(snapshot):
+    cache = SimpleCache()
+    cache.restore(snapshot)
+    cache.set('a', 1)
+    cache.save(snapshot)
+    cache.set('b', 'x' * 100)
+    cache.save(snapshot)
+
+    # As if the process died part way through an append
+    with open(snapshot.path, 'r+b') as fo:
+        fo.truncate(os.path.getsize(snapshot.path) - 10)
+
+    restored = _restored(snapshot)
+    assert restored.get('a') == 1
+    assert restored.get('b') is None
+
+
+def test_missing_snapshot_restores_nothing(snapshot):
+    cache = _restored(snapshot)
+    assert cache.get('a') is None
+
+
+def test_sigterm_compacts_the_snapshot(snapshot):
+    import signal
+    import subprocess
+    import sys
+
+    script = (
+        'import sys, time\n'
+        'sys.path.insert(0, {root!r})\n'
+        'from app.cache import CacheSnapshot, SimpleCache, start_snapshots\n'
+        'snapshot = CacheSnapshot({path!r})\n'
+        'cache = SimpleCache()\n'
+        'cache.restore(snapshot)\n'
+        'start_snapshots(cache, snapshot, 3600)\n'
+        'cache.set("a", 1)\n'
+        'print("ready", flush=True)\n'
+        'time.sleep(60)\n'
+    ).format(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path=snapshot.path)
+
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+    assert process.stdout.readline().strip() == b'ready'
+    process.send_signal(signal.SIGTERM)
+
+    assert process.wait(timeout=10) == -signal.SIGTERM
+    assert _restored(snapshot).get('a') == 1
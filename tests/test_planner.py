@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+pytest.importorskip('geopy')
+
+from app.planner import MAX_TILE_RADIUS_METERS, SearchArea, _meters_between, tiles
+
+AREAS = [
+    SearchArea(40.7128, -74.006, 5000),
+    SearchArea(0.0005, 0.0005, 3000),
+    SearchArea(-33.8688, 151.2093, 4000),
+    SearchArea(64.1466, -21.9426, 5000),
+    SearchArea(0.0, 179.99, 3000),
+]
+
+
+def _sample_points(area, count=500, seed=0):
+    """Points spread over the area, its edge included"""
+    rng = random.Random(seed)
+    points = []
+
+    for i in range(count):
+        # Rings out to just inside the edge, at random bearings
+        fraction = 1.0 if i % 5 == 0 else rng.random()
+        bearing = rng.uniform(0, 360)
+        point = _destination(area, area.radius * fraction * 0.999, bearing)
+        points.append(point)
+
+    return points
+
+
+def _destination(area, meters, bearing):
+    from geopy.distance import great_circle
+    point = great_circle(meters=meters).destination(area.center, bearing)
+    return point.latitude, point.longitude
+
+
+@pytest.mark.parametrize('area', AREAS)
+def test_tiles_cover_the_area(area):
+    covering = tiles(area, 1000, 100)
+
+    for point in _sample_points(area):
+        assert any(_meters_between(tile.center, point) <= tile.radius for tile in covering), point
+
+
+@pytest.mark.parametrize('area', AREAS)
+def test_tiles_are_capped(area):
+    covering = tiles(area, 1000, 19)
+
+    assert 0 < len(covering) <= 19
+    assert all(tile.radius > 1000 for tile in covering)
+
+
+def test_tiles_are_the_same_for_overlapping_areas():
+    a = set(tiles(SearchArea(40.7128, -74.006, 3000), 1000, 100))
+    b = set(tiles(SearchArea(40.7228, -74.006, 3000), 1000, 100))
+
+    assert len(a & b) > len(a) / 2
+
+
+def test_area_within_a_tile_is_not_tiled():
+    area = SearchArea(40.7128, -74.006, 800)
+    assert tiles(area, 1000, 19) == [area]
+
+
+def test_tile_radius_is_clamped():
+    area = SearchArea(40.7128, -74.006, 60000)
+    assert tiles(area, 100000, 19) != [area]
+
+    covering = tiles(SearchArea(40.7128, -74.006, 2000000), 1000, 19)
+    assert len(covering) == 19
+    assert all(tile.radius <= MAX_TILE_RADIUS_METERS for tile in covering)
@@ -0,0 +1,193 @@
+import threading
+
+import pytest
+
+from app.planner import SearchArea
+from conftest import ORIGIN
+
+
+def test_search_pages_through_upstream(engine, googleplaces):
+    places, completed = engine._search_places(ORIGIN[0], ORIGIN[1], 1000, 60)
+
+    assert completed
+    assert len(places) == 60
+    assert [call[2] for call in googleplaces.places_calls] == [None, '20', '40']
+
+
+def test_search_cut_short_is_not_completed(engine, googleplaces, monkeypatch):
+    monkeypatch.setattr('app.search.PAGE_TOKEN_DELAY_SECS', 0)
+    googleplaces.fail_page_tokens = True
+
+    places, completed = engine._search_places(ORIGIN[0], ORIGIN[1], 1000, 60)
+
+    assert not completed
+    assert len(places) == 20
+
+
+def test_upstream_searches_are_bounded_per_process(engine, googleplaces):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+    get_places = googleplaces.get_places
+
+    def counting_get_places(*args, **kwargs):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        try:
+            return get_places(*args, **kwargs)
+        finally:
+            with lock:
+                in_flight.pop()
+
+    googleplaces.get_places = counting_get_places
+    engine._upstream_searches = threading.BoundedSemaphore(2)
+    other = engine.with_client(googleplaces)
+
+    threads = [threading.Thread(target=e.search, args=(ORIGIN[0], ORIGIN[1], 1200)) for e in (engine, other)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert googleplaces.places_calls
+    assert max(peak) <= 2
+
+
+def test_cached_places_are_not_changed_by_details(engine):
+    engine.search(ORIGIN[0], ORIGIN[1], 300)
+
+    places, _ = engine._get_cached_places(SearchArea(ORIGIN[0], ORIGIN[1], 300), 10)
+    assert places
+    assert all('formatted_address' not in p for p in places)
+
+
+
+def _uuids(venues):
+    return [v['uuid'] for v in venues]
+
+
+def test_search_page_is_the_same_as_search(engine):
+    for radius in (450, 1200):
+        venues, cursor = engine.search_page(ORIGIN[0], ORIGIN[1], radius)
+
+        assert set(_uuids(venues)) == set(_uuids(engine.search(ORIGIN[0], ORIGIN[1], radius)))
+        assert cursor is not None
+
+
+def test_cursor_pages_through_all_of_the_places(engine, googleplaces):
+    venues, cursor = engine.search_page(ORIGIN[0], ORIGIN[1], 450)
+    seen = _uuids(venues)
+    pages = 1
+
+    while cursor is not None:
+        venues, cursor = engine.search_next_page(cursor)
+        assert venues
+        seen.extend(_uuids(venues))
+        pages += 1
+
+    assert pages == 6
+    assert len(seen) == len(set(seen)) == 60
+    # Each upstream page is only fetched once
+    assert [call[2] for call in googleplaces.places_calls] == [None, '20', '40']
+
+
+def test_cursor_state_is_plain_data(engine):
+    import pickle
+
+    _, cursor = engine.search_page(ORIGIN[0], ORIGIN[1], 450)
+    state = pickle.loads(pickle.dumps(engine.cache.get('cursor:' + cursor)))
+
+    assert all(type(p).__name__ == 'PlaceResult' for p in state['places'])
+    assert all(type(area) is tuple for area, _ in state['page_tokens'])
+
+
+def test_unknown_cursor(engine):
+    from app.search import NoSuchCursorError
+
+    with pytest.raises(NoSuchCursorError):
+        engine.search_next_page('missing')
+
+
+def test_is_cached_when_search_makes_no_upstream_calls(engine, googleplaces):
+    for radius in (450, 1200):
+        assert not engine.is_cached(ORIGIN[0], ORIGIN[1], radius)
+        engine.search(ORIGIN[0], ORIGIN[1], radius)
+        assert engine.is_cached(ORIGIN[0], ORIGIN[1], radius)
+
+        calls = len(googleplaces.places_calls), len(googleplaces.details_calls)
+        engine.search(ORIGIN[0], ORIGIN[1], radius)
+        assert (len(googleplaces.places_calls), len(googleplaces.details_calls)) == calls
+
+
+def test_cache_misses_are_not_kept(engine):
+    engine.is_cached(ORIGIN[0], ORIGIN[1], 450)
+    assert not engine.cache._cache
+
+
+def test_cached_values_pickle(engine):
+    import pickle
+
+    engine.search(ORIGIN[0], ORIGIN[1], 450)
+    engine.search(ORIGIN[0], ORIGIN[1], 1200)
+    engine.search_page(ORIGIN[0], ORIGIN[1], 450)
+
+    assert engine.cache._cache
+    for key, value in engine.cache._cache.items():
+        pickle.dumps(value)
+
+
+def _first_page_searches(googleplaces):
+    return [call for call in googleplaces.places_calls if call[2] is None]
+
+
+def test_batch_identical_queries_share_a_search(engine, googleplaces):
+    results = engine.batch_search([(ORIGIN[0], ORIGIN[1], 300)] * 3)
+
+    assert len(results) == 3
+    assert _uuids(results[0]) == _uuids(results[1]) == _uuids(results[2])
+    assert len(_first_page_searches(googleplaces)) == 1
+    assert len(googleplaces.details_calls) == len(set(googleplaces.details_calls)) == 10
+
+
+def test_batch_query_within_an_exhaustive_search_shares_it(engine, googleplaces):
+    results = engine.batch_search([(ORIGIN[0], ORIGIN[1], 150), (ORIGIN[0], ORIGIN[1], 50)])
+
+    assert len(results[0]) == 9
+    assert _uuids(results[1]) == ['p7-7']
+    assert len(_first_page_searches(googleplaces)) == 1
+
+
+def test_batch_route_queries_share_tiles(engine, googleplaces):
+    route = [(ORIGIN[0] + i * 0.001, ORIGIN[1], 300) for i in range(6)]
+
+    results = engine.batch_search(route)
+
+    assert all(len(venues) == 10 for venues in results)
+    assert len(_first_page_searches(googleplaces)) < len(route)
+    assert len(googleplaces.details_calls) == len(set(googleplaces.details_calls))
+
+
+def test_batch_far_apart_queries_are_searched_on_their_own(engine, googleplaces):
+    queries = [(ORIGIN[0], ORIGIN[1], 300), (ORIGIN[0] + 0.05, ORIGIN[1], 300)]
+
+    engine.batch_search(queries)
+
+    assert sorted(call[:2] for call in _first_page_searches(googleplaces)) == \
+        sorted(('{},{}'.format(lat, lon), radius) for lat, lon, radius in queries)
+
+
+def test_batch_large_queries_share_tiles(engine, googleplaces):
+    queries = [(ORIGIN[0], ORIGIN[1], 1200), (ORIGIN[0] + 0.002, ORIGIN[1], 1200)]
+
+    results = engine.batch_search(queries)
+    shared = len(_first_page_searches(googleplaces))
+
+    googleplaces.places_calls.clear()
+    engine.cache = type(engine.cache)()
+    engine.search(*queries[0])
+    engine.cache = type(engine.cache)()
+    engine.search(*queries[1])
+
+    assert all(len(venues) == 10 for venues in results)
+    assert shared < len(_first_page_searches(googleplaces))
@@ -0,0 +1,50 @@
+import pytest
+
+from app.warm import BudgetedGooglePlaces, ManifestEntry, UpstreamBudgetExhaustedError, warm
+from conftest import ORIGIN
+
+MANIFEST = [
+    ManifestEntry(ORIGIN[0], ORIGIN[1], 300, 10),
+    ManifestEntry(ORIGIN[0] + 0.005, ORIGIN[1], 300, 5),
+    ManifestEntry(ORIGIN[0] - 0.005, ORIGIN[1], 300, 1),
+]
+
+
+def test_budget_is_enforced():
+    class Client(object):
+        def get_places(self, location, radius):
+            return []
+
+    googleplaces = BudgetedGooglePlaces(Client(), budget=1)
+    googleplaces.get_places(location='0,0', radius=1)
+
+    with pytest.raises(UpstreamBudgetExhaustedError):
+        googleplaces.get_places(location='0,0', radius=1)
+    assert googleplaces.used == 1
+
+
+def test_warm_fills_what_a_search_reads(engine, googleplaces):
+    report = warm(engine, MANIFEST, budget=None, concurrency=2)
+
+    assert (report.searches, report.skipped, report.failed) == (3, 0, 0)
+    assert report.upstream_calls == len(googleplaces.places_calls) + len(googleplaces.details_calls)
+    assert all(engine.is_cached(e.latitude, e.longitude, e.search_radius_meters) for e in MANIFEST)
+
+
+def test_warm_stops_at_the_budget(engine, googleplaces):
+    # One places call and the details for 10 places
+    report = warm(engine, MANIFEST, budget=11, concurrency=1)
+
+    assert report.upstream_calls == 11
+    assert (report.searches, report.skipped) == (1, 2)
+    assert engine.is_cached(ORIGIN[0], ORIGIN[1], 300)
+
+
+def test_warm_reports_failed_entries(engine, googleplaces):
+    def failing_get_places(location, radius, pagetoken=None):
+        raise RuntimeError('upstream down')
+
+    googleplaces.get_places = failing_get_places
+    report = warm(engine, MANIFEST, budget=None, concurrency=2)
+
+    assert (report.searches, report.failed) == (0, 3)
@@ -6,6 +6,11 @@ wsgi.py
 This file is the wsgi entry point of the webservice code when
 running behind a full webstack. For general development usage, refer
 to the `manage` script located in the  source repository.
+
+    RUNTIME_CONFIG=prod wsgi.py serve
+
+runs the production server, SERVER_WORKERS preforked eventlet workers
+sharing the app that is created (and monkey patched) here first.
 """
 import eventlet
 eventlet.monkey_patch()
@@ -27,7 +32,15 @@ def main():
     print('RUNTIME_CONFIG={}'.format(_config_name))
     import app
     instance = app.create(_root_app_path, _config_name)
-    instance.run('0.0.0.0', port=instance.config.get('BIND_PORT'))
+
+    if sys.argv[1:2] == ['serve']:
+        from app.server import serve
+        serve(instance)
+    else:
+        from app.api import start_background_tasks
+        instance.extensions['MyRestService'].googleplaces.load()
+        start_background_tasks(instance)
+        instance.run('0.0.0.0', port=instance.config.get('BIND_PORT'))
 
 if __name__ == '__main__':
     main()